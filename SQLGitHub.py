@@ -5,6 +5,6 @@ from components import top_level
 
 
 if __name__ == "__main__":
-    token, output = config_loader.Load("config")
-    sqlserv = top_level.SQLGitHub(token, output)
+    token, output, settings = config_loader.Load("config")
+    sqlserv = top_level.SQLGitHub(token, output, **settings)
     sqlserv.Start()
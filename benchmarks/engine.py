@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""Benchmarks the in-memory engine over synthetic tables, without any network.
+
+Tables shaped like repos, issues and commits are generated at each size.
+Expressions, grouping and ordering are timed on their own, and full queries
+through SgSession.Execute, with the tables served from a SgSourceStore.
+Results are written as JSON; with --compare, the ratios to an earlier run are printed.
+
+Sample Usage:
+    ./benchmarks/engine.py --sizes 1000,100000 -o before.json
+    ./benchmarks/engine.py --sizes 1000,100000 -o after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from components import parser
+from components import source_store
+from components import table as tb
+from components import tokenizer
+from components.expression import SgExpression
+from components.grouping import SgGrouping
+from components.ordering import SgOrdering
+
+WORDS = [u"fix", u"crash", u"add", u"support", u"for", u"parser", u"layout", u"flaky", u"test", u"update",
+         u"docs", u"memory", u"leak", u"in", u"renderer", u"bump", u"version", u"refactor", u"style", u"webgl"]
+USERS = [u"user%d" % i for i in range(500)]
+LANGUAGES = [u"Rust", u"Python", u"C++", u"JavaScript", u"Go", None]
+
+EXPRESSIONS = [("arithmetic", u"issues", u"comments * 2 + number % 7 - comments / 3"),
+               ("like", u"issues", u"title like \"%crash%\""),
+               ("regexp", u"commits", u"message regexp \"^(fix|add) \""),
+               ("string functions", u"commits", u"concat(upper(login), \"-\", substr(sha, 1, 7))")]
+
+QUERIES = [("top users by open issues", u"select user, count(number) from bench.issues where state = \"open\" group by user order by count(number) desc limit 10"),
+           ("most commented crashes", u"select title, comments from bench.issues where title like \"%crash%\" order by comments desc limit 20"),
+           ("open fix crashes", u"select number, title from bench.issues where title regexp \".*(fix|add) crash.*\" and state = \"open\""),
+           ("commits per author", u"select login, count(sha) from bench.commits group by login"),
+           ("most starred repos", u"select name, stargazers_count from bench.repos order by stargazers_count desc, name limit 10")]
+
+
+def _Sentence(rand, words):
+    return u" ".join(rand.choice(WORDS) for _ in range(words))
+
+def _Timestamp(rand):
+    return datetime.datetime(2018, 1, 1) - datetime.timedelta(seconds=rand.randint(0, 3 * 365 * 86400))
+
+def GenerateTables(rows, seed=0):
+    """Returns {source: SgTable} of rows synthetic repos, issues and commits."""
+    rand = random.Random(seed)
+    repos = tb.SgTable()
+    repos.SetFields([u"name", u"description", u"language", u"stargazers_count", u"forks_count", u"created_at"])
+    repos.SetCols([[u"repo%d" % i for i in range(rows)],
+                   [_Sentence(rand, 6) for _ in range(rows)],
+                   [rand.choice(LANGUAGES) for _ in range(rows)],
+                   [int(rand.paretovariate(1.2)) for _ in range(rows)],
+                   [rand.randint(0, 500) for _ in range(rows)],
+                   [_Timestamp(rand) for _ in range(rows)]], rows)
+    issues = tb.SgTable()
+    issues.SetFields([u"number", u"title", u"state", u"user", u"comments", u"labels", u"created_at"])
+    issues.SetCols([range(rows, 0, -1),
+                    [_Sentence(rand, 5) for _ in range(rows)],
+                    [u"open" if rand.random() < 0.3 else u"closed" for _ in range(rows)],
+                    [rand.choice(USERS) for _ in range(rows)],
+                    [rand.randint(0, 50) for _ in range(rows)],
+                    [rand.sample(WORDS, rand.randint(0, 3)) for _ in range(rows)],
+                    [_Timestamp(rand) for _ in range(rows)]], rows)
+    commits = tb.SgTable()
+    commits.SetFields([u"sha", u"login", u"message"])
+    commits.SetCols([[u"%040x" % rand.getrandbits(160) for _ in range(rows)],
+                     [rand.choice(USERS) for _ in range(rows)],
+                     [_Sentence(rand, 8) for _ in range(rows)]], rows)
+    return {u"repos": repos, u"issues": issues, u"commits": commits}
+
+def GetBenchmarks(tables):
+    """Returns [(name, setup)] where setup() prepares a run and returns the function to time."""
+    benchmarks = []
+    for name, source, expr in EXPRESSIONS:
+        benchmarks.append(("expression: " + name, lambda source=source, expr=expr: lambda: SgExpression.EvaluateExpression(tables[source], expr)))
+
+    def SetupGrouping():
+        table = SgExpression.EvaluateExpressions(tables[u"issues"], [u"title", u"comments", u"user"])
+        return lambda: SgGrouping.GenerateGroups(table, [u"user"])
+    benchmarks.append(("GenerateGroups: issues by user", SetupGrouping))
+
+    def SetupOrdering(limit=None):
+        table = SgExpression.EvaluateExpressions(tables[u"issues"], [u"title", u"comments", u"number"])
+        return lambda: SgOrdering(table, [-1, 1]).Sort(limit=limit)  # sorts in place, so a fresh table per run
+    benchmarks.append(("Sort: issues by comments desc, number", SetupOrdering))
+    benchmarks.append(("Sort: top 10 issues by comments desc, number", lambda: SetupOrdering(10)))
+
+    store = source_store.SgSourceStore(sys.maxint)
+    for source, table in tables.items():
+        store.Put(u"bench." + source, {}, table.GetFields(), [], table)
+    sql_parser = parser.SgParser(None, {"store": store})  # every source is in the store, no GitHub needed
+    for name, sql in QUERIES:
+        tokens = tokenizer.SgTokenizer.Tokenize(sql)
+        benchmarks.append(("query: " + name, lambda tokens=tokens: sql_parser.Parse(tokens).Execute))
+    return benchmarks
+
+def Run(sizes, repeat):
+    results = []
+    for rows in sizes:
+        tables = GenerateTables(rows)
+        for name, setup in GetBenchmarks(tables):
+            times = []
+            for _ in range(repeat):
+                func = setup()
+                start_time = time.time()
+                func()
+                times.append(time.time() - start_time)
+            times.sort()
+            results.append({"benchmark": name, "rows": rows, "times": times, "min": times[0], "median": times[len(times) // 2]})
+            sys.stderr.write("%-50s %8d rows  %8.4fs\n" % (name, rows, times[0]))
+    return results
+
+def Compare(results, baseline):
+    """Prints the ratio of each benchmark's min time to the one in baseline (an earlier run)."""
+    before = dict(((result["benchmark"], result["rows"]), result["min"]) for result in baseline["results"])
+    for result in results:
+        key = (result["benchmark"], result["rows"])
+        if key in before and before[key] > 0:
+            sys.stderr.write("%-50s %8d rows  %6.2fx\n" % (key[0], key[1], result["min"] / before[key]))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--sizes", default="1000,100000,1000000", help="comma-separated numbers of rows")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs of each benchmark (min and median are reported)")
+    arg_parser.add_argument("-o", "--output-file", help="write the JSON results to a file instead of stdout")
+    arg_parser.add_argument("--compare", metavar="JSON", help="print the time ratios to the results of an earlier run")
+    args = arg_parser.parse_args()
+
+    results = Run([int(size) for size in args.sizes.split(",")], args.repeat)
+    report = {"created_at": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    if args.compare:
+        with open(args.compare) as f:
+            Compare(results, json.load(f))
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
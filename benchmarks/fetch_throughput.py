@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Measures the throughput of SgTableFetcher.Fetch against a local GitHub stand-in.
+
+Every source is fetched at every concurrency level from a stand-in serving a
+recording (a synthetic org by default), with the requests going through a
+SgRequestScheduler like in SQLGitHub. Wall time, requests per second and rows
+per second are reported as JSON.
+
+Sample Usage:
+    ./benchmarks/fetch_throughput.py --repos 8 --items 2000 --latency 0.05 --concurrency 1,4,16
+    ./benchmarks/fetch_throughput.py --recording rec --org servo --sources issues --quota 500 --quota-window 60
+    ./benchmarks/fetch_throughput.py --recording rec --org servo --record-from https://api.github.com --token <token>
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from github import Github, GithubException
+
+import github_standin
+from components import request_scheduler
+from components import table_fetcher
+
+# source -> (label suffix, fields), only fields in list responses (the others cost a request per row)
+SOURCES = {"repos": (u"repos", [u"name", u"description", u"language", u"stargazers_count", u"updated_at"]),
+           "issues": (u"issues.all", [u"number", u"title", u"state", u"user", u"labels", u"comments", u"updated_at"]),
+           "pulls": (u"pulls.all", [u"number", u"title", u"state", u"user", u"head", u"base", u"merged_at"]),
+           "commits": (u"commits", [u"sha", u"login", u"author", u"message"])}
+
+
+def Measure(base_url, org, source, concurrency, per_page, token):
+    """Fetches source of org through the stand-in, returns the measurements."""
+    github = Github(token, base_url=base_url, per_page=per_page)
+    scheduler = request_scheduler.SgRequestScheduler()
+    scheduler.Install(github)
+    label, fields = SOURCES[source]
+    fetcher = table_fetcher.SgTableFetcher(github, fields, concurrency=concurrency)
+    error = None
+    rows = 0
+    start_time = time.time()
+    try:
+        rows = len(fetcher.Fetch(u"%s.%s" % (org, label)))
+    except GithubException as e:
+        error = "%s %s" % (e.status, e.data)
+    wall = time.time() - start_time
+    stats = scheduler.GetStats()
+    return {"source": source, "concurrency": concurrency, "wall": wall, "rows": rows,
+            "requests": stats["requests"], "retries": stats["retries"], "waited": stats["waited"], "bytes": stats["bytes"],
+            "requests_per_second": stats["requests"] / wall, "rows_per_second": rows / wall, "error": error}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--recording", help="directory of the recorded responses (a synthetic org is generated if not given)")
+    arg_parser.add_argument("--org", default="bench")
+    arg_parser.add_argument("--repos", type=int, default=8, help="repos of the synthetic org")
+    arg_parser.add_argument("--items", type=int, default=1000, help="issues, pulls and commits of each synthetic repo")
+    arg_parser.add_argument("--sources", default="repos,issues,pulls,commits")
+    arg_parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    arg_parser.add_argument("--repeat", type=int, default=1)
+    arg_parser.add_argument("--per-page", type=int, default=100)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every request")
+    arg_parser.add_argument("--jitter", type=float, default=0.2, help="the latency varies by up to this fraction")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of the requests failed")
+    arg_parser.add_argument("--error-status", type=int, default=502, help="status of the failed requests (403/429 are secondary rate limits)")
+    arg_parser.add_argument("--quota", type=int, help="requests allowed per quota window")
+    arg_parser.add_argument("--quota-window", type=int, default=3600, help="seconds")
+    arg_parser.add_argument("--record-from", metavar="URL", help="record what wasn't recorded from there first, eg. " + github_standin.GITHUB_URL)
+    arg_parser.add_argument("--token", default="standin", help="token for --record-from")
+    arg_parser.add_argument("-o", "--output-file", help="write the JSON results to a file instead of stdout")
+    args = arg_parser.parse_args()
+
+    directory = args.recording or tempfile.mkdtemp(prefix="standin")
+    recording = github_standin.SgRecording(directory)
+    if not args.recording:
+        github_standin.Generate(recording, args.org, args.repos, args.items)
+    sources = args.sources.split(",")
+    try:
+        if args.record_from:  # one pass to record, the measurements only replay
+            recorder = github_standin.SgGitHubStandIn(recording, record_from=args.record_from, token=args.token)
+            base_url = recorder.Start()
+            for source in sources:
+                Measure(base_url, args.org, source, 1, args.per_page, args.token)
+            recorder.Stop()
+
+        results = []
+        for source in sources:
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                for _ in range(args.repeat):
+                    standin = github_standin.SgGitHubStandIn(recording, args.latency, args.jitter, args.error_rate, args.error_status,
+                                                             args.quota, args.quota_window, seed=0)
+                    result = Measure(standin.Start(), args.org, source, concurrency, args.per_page, args.token)
+                    standin.Stop()
+                    result["standin"] = standin.GetStats()
+                    results.append(result)
+                    sys.stderr.write("%-8s concurrency %3d  %8.3fs  %8.1f requests/s  %9.1f rows/s%s\n" %
+                                     (source, concurrency, result["wall"], result["requests_per_second"], result["rows_per_second"],
+                                      "  error: " + result["error"] if result["error"] else ""))
+    finally:
+        if not args.recording:
+            shutil.rmtree(directory, True)
+
+    report = {"created_at": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "standin": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                          "quota": args.quota, "quota_window": args.quota_window, "per_page": args.per_page},
+              "results": results}
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
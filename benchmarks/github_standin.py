@@ -0,0 +1,446 @@
+#!/usr/bin/env python
+"""A local stand-in for the GitHub API, serving recorded responses.
+
+A recording is a directory of responses (an org, its repos, their issues, pulls
+and commits ...), either recorded from GitHub through the stand-in or generated.
+Listings are recorded whole and paginated when served, with the Link and
+X-RateLimit-* headers GitHub sends, so a Github(base_url=...) pointed at the
+stand-in pages through them like through the real API. Requests can be slowed
+down, failed at random and counted against a quota.
+
+Sample Usage:
+    ./benchmarks/github_standin.py --recording rec --generate bench --repos 8 --items 2000
+    ./benchmarks/github_standin.py --recording rec --port 8000 --latency 0.05 --error-rate 0.01 --quota 5000
+    ./benchmarks/github_standin.py --recording rec --record-from https://api.github.com --token <token>
+"""
+
+import argparse
+import BaseHTTPServer
+import datetime
+import hashlib
+import json
+import os
+import random
+import SocketServer
+import sys
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+
+GITHUB_URL = "https://api.github.com"
+
+_PAGING_PARAMS = ("page", "per_page", "access_token")
+_FILTER_PARAMS = ("state", "since", "until", "labels", "creator", "assignee", "author", "base", "sort", "direction")
+_MAX_PER_PAGE = 100
+
+# repo URL fields -> their paths under the repo's API URL
+_REPO_URL_PATHS = {"archive_url": "/{archive_format}{/ref}", "assignees_url": "/assignees{/user}", "blobs_url": "/git/blobs{/sha}",
+                   "branches_url": "/branches{/branch}", "collaborators_url": "/collaborators{/collaborator}",
+                   "comments_url": "/comments{/number}", "commits_url": "/commits{/sha}", "compare_url": "/compare/{base}...{head}",
+                   "contents_url": "/contents/{+path}", "contributors_url": "/contributors", "downloads_url": "/downloads",
+                   "events_url": "/events", "forks_url": "/forks", "git_commits_url": "/git/commits{/sha}",
+                   "git_refs_url": "/git/refs{/sha}", "git_tags_url": "/git/tags{/sha}", "hooks_url": "/hooks",
+                   "issue_comment_url": "/issues/comments{/number}", "issue_events_url": "/issues/events{/number}",
+                   "issues_url": "/issues{/number}", "keys_url": "/keys{/key_id}", "labels_url": "/labels{/name}",
+                   "languages_url": "/languages", "merges_url": "/merges", "milestones_url": "/milestones{/number}",
+                   "notifications_url": "/notifications{?since,all,participating}", "pulls_url": "/pulls{/number}",
+                   "stargazers_url": "/stargazers", "statuses_url": "/statuses/{sha}", "subscribers_url": "/subscribers",
+                   "subscription_url": "/subscription", "tags_url": "/tags", "teams_url": "/teams", "trees_url": "/git/trees{/sha}"}
+
+
+def _GetKey(path, query):
+    """Returns the file name of the response to path with query (without its paging parameters)."""
+    params = sorted((key, val) for key, val in query.items() if key not in _PAGING_PARAMS)
+    return hashlib.sha1(json.dumps([path.rstrip("/").lower(), params])).hexdigest() + ".json"
+
+def _GetNextLink(headers):
+    for link in headers.get("link", "").split(", "):
+        if link.endswith('rel="next"'):
+            return link[1:link.index(">")]
+    return None
+
+def _GetUpdated(item):
+    if "commit" in item:
+        return item["commit"].get("committer", {}).get("date")
+    return item.get("updated_at")
+
+def _GetLogin(user):
+    return user.get("login") if user else None
+
+def _MatchesAssignee(item, assignee):
+    """assignee is a login, "none" for items without one or "*" for items with any."""
+    logins = set(_GetLogin(user) for user in item.get("assignees") or [item.get("assignee")] if user)
+    if assignee == "none":
+        return not logins
+    return bool(logins) if assignee == "*" else assignee in logins
+
+def _Filter(items, query):
+    """Filters a listing recorded with state=all (or no filter at all) the way GitHub would for query."""
+    state = query.get("state", "open")
+    labels = set(query["labels"].split(",")) if query.get("labels") else set()
+    ret = []
+    for item in items:
+        updated = _GetUpdated(item)
+        if "state" in item and state != "all" and item["state"] != state:
+            continue
+        if labels and not labels <= set(label["name"] for label in item.get("labels", [])):
+            continue
+        if query.get("creator") and _GetLogin(item.get("user")) != query["creator"]:
+            continue
+        if query.get("assignee") and not _MatchesAssignee(item, query["assignee"]):
+            continue
+        if query.get("author") and query["author"] not in (_GetLogin(item.get("author")), item.get("commit", {}).get("author", {}).get("email")):
+            continue
+        if query.get("base") and (item.get("base") or {}).get("ref") != query["base"]:
+            continue
+        if query.get("since") and updated and updated < query["since"]:
+            continue
+        if query.get("until") and updated and updated > query["until"]:
+            continue
+        ret.append(item)
+    if query.get("sort") in ("created", "updated"):
+        ret.sort(key=lambda item: item.get(query["sort"] + "_at"), reverse=query.get("direction", "desc") == "desc")
+    return ret
+
+
+class SgRecording:
+    """A directory of recorded responses, listings are stored whole."""
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._loaded = {}  # file name -> (body, base url), the responses served so far
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def Get(self, path, query):
+        """Returns (body, base url it refers to) of the response to path with query, None if it wasn't recorded."""
+        key = _GetKey(path, query)
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+        ret = self._Load(path, query)
+        if ret is not None:
+            with self._lock:
+                self._loaded[key] = ret
+        return ret
+
+    def _Load(self, path, query):
+        names = [_GetKey(path, query)]
+        if any(key in query for key in _FILTER_PARAMS):  # a superset to filter
+            superset = dict((key, val) for key, val in query.items() if key not in _FILTER_PARAMS)
+            names += [_GetKey(path, dict(superset, state="all")), _GetKey(path, superset)]
+        for idx, name in enumerate(names):
+            try:
+                with open(os.path.join(self._directory, name)) as f:
+                    entry = json.load(f)
+            except (IOError, ValueError):
+                continue
+            body = entry["body"]
+            return (_Filter(body, query) if idx and isinstance(body, list) else body), entry["base_url"]
+        return None
+
+    def Put(self, path, query, body, base_url=GITHUB_URL):
+        name = _GetKey(path, query)
+        tmp_path = os.path.join(self._directory, name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"path": path, "query": query, "base_url": base_url, "body": body}, f)
+        os.rename(tmp_path, os.path.join(self._directory, name))
+        with self._lock:
+            self._loaded = {}  # filtered ones may include it
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.standin._Handle(self)
+
+
+class SgGitHubStandIn:
+    """A local stand-in for the GitHub API, serving a SgRecording."""
+
+    def __init__(self, recording, latency=0.0, jitter=0.0, error_rate=0.0, error_status=502,
+                 quota=None, quota_window=3600, record_from=None, token=None, seed=None):
+        self._recording = recording
+        self._latency = latency  # seconds added to every request
+        self._jitter = jitter  # the latency varies by up to this fraction
+        self._error_rate = error_rate  # fraction of the requests failed with error_status
+        self._error_status = error_status
+        self._quota = quota  # requests per quota_window seconds, unlimited if None
+        self._quota_window = quota_window
+        self._record_from = record_from  # eg. GITHUB_URL, requests that weren't recorded are recorded from there
+        self._token = token
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._remaining = quota
+        self._reset = int(time.time()) + quota_window
+        self._stats = {"requests": 0, "not_modified": 0, "errors": 0, "rate_limited": 0, "not_found": 0, "recorded": 0}
+        self._server = None
+        self.base_url = None
+
+    def _Count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _UseQuota(self):
+        """Counts a request against the quota, returns (whether it's allowed, the X-RateLimit-* headers)."""
+        with self._lock:
+            now = time.time()
+            if self._quota is None:
+                return True, {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "5000", "X-RateLimit-Reset": str(int(now) + 3600)}
+            if now >= self._reset:
+                self._remaining = self._quota
+                self._reset = int(now) + self._quota_window
+            headers = {"X-RateLimit-Limit": str(self._quota), "X-RateLimit-Reset": str(self._reset)}
+            if self._remaining == 0:
+                headers["X-RateLimit-Remaining"] = "0"
+                return False, headers
+            self._remaining -= 1
+            headers["X-RateLimit-Remaining"] = str(self._remaining)
+            return True, headers
+
+    def _Record(self, path, query):
+        """Requests path from record_from, following every page of a listing, and records it."""
+        params = dict(query)
+        for key in _PAGING_PARAMS:
+            params.pop(key, None)
+        url = self._record_from + path + "?" + urllib.urlencode(dict(params, per_page=_MAX_PER_PAGE))
+        body = None
+        while url:
+            request = urllib2.Request(url, headers={"Accept": "application/vnd.github.v3+json"})
+            if self._token:
+                request.add_header("Authorization", "token " + self._token)
+            response = urllib2.urlopen(request)
+            page = json.load(response)
+            if not isinstance(page, list):
+                body = page
+                break
+            body = (body or []) + page
+            url = _GetNextLink(dict((key.lower(), val) for key, val in response.info().items()))
+        self._recording.Put(path, query, body, self._record_from)
+        self._Count("recorded")
+        return body, self._record_from
+
+    def _Paginate(self, path, query, items):
+        """Returns the requested page of items and its Link header (None if it's the only page)."""
+        per_page = min(int(query.get("per_page", 30)), _MAX_PER_PAGE)
+        page = max(1, int(query.get("page", 1)))
+        last_page = max(1, (len(items) + per_page - 1) // per_page)
+        def Link(num, rel):
+            params = sorted(dict(query, page=num, per_page=per_page).items())
+            return '<%s%s?%s>; rel="%s"' % (self.base_url, path, urllib.urlencode(params), rel)
+        links = []
+        if page < last_page:
+            links += [Link(page + 1, "next"), Link(last_page, "last")]
+        if page > 1:
+            links += [Link(1, "first"), Link(page - 1, "prev")]
+        return items[(page - 1) * per_page:page * per_page], ", ".join(links) or None
+
+    def _Respond(self, handler, status, body, headers):
+        data = body if isinstance(body, basestring) else json.dumps(body)
+        handler.send_response(status)
+        for key, val in headers.items():
+            handler.send_header(key, val)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _Handle(self, handler):
+        self._Count("requests")
+        if self._latency:
+            time.sleep(self._latency * self._random.uniform(1 - self._jitter, 1 + self._jitter))
+        url = urlparse.urlparse(handler.path)
+        path = url.path.rstrip("/")
+        query = dict(urlparse.parse_qsl(url.query))
+        if self._random.random() < self._error_rate:
+            self._Count("errors")
+            headers = {"Retry-After": "1"} if self._error_status in (403, 429) else {}
+            return self._Respond(handler, self._error_status, {"message": "You have exceeded a secondary rate limit (injected)."
+                                                              if headers else "Server Error (injected)"}, headers)
+
+        recorded = self._recording.Get(path, query)
+        if recorded is None and self._record_from:
+            with self._record_lock:
+                recorded = self._recording.Get(path, query)
+                if recorded is None:
+                    try:
+                        recorded = self._Record(path, query)
+                    except urllib2.HTTPError as e:
+                        sys.stderr.write("Recording %s failed: %s\n" % (handler.path, e))
+        if recorded is None:
+            self._Count("not_found")
+            return self._Respond(handler, 404, {"message": "Not Found"}, {})
+        body, base_url = recorded
+        headers = {}
+        if isinstance(body, list):
+            body, link = self._Paginate(path, query, body)
+            if link:
+                headers["Link"] = link
+        data = json.dumps(body).replace(base_url, self.base_url).encode("utf-8")  # urls in payloads point to the stand-in
+        headers["ETag"] = '"%s"' % hashlib.sha1(data).hexdigest()
+        if handler.headers.get("If-None-Match") == headers["ETag"]:  # 304s don't count against the quota
+            self._Count("not_modified")
+            handler.send_response(304)
+            handler.send_header("ETag", headers["ETag"])
+            handler.end_headers()
+            return
+
+        allowed, quota_headers = self._UseQuota()
+        if not allowed:
+            self._Count("rate_limited")
+            return self._Respond(handler, 403, {"message": "API rate limit exceeded (stand-in quota)."}, quota_headers)
+        headers.update(quota_headers)
+        self._Respond(handler, 200, data, headers)
+
+    def Start(self, port=0):
+        """Serves in a background thread, returns the base URL to give Github(base_url=...)."""
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.standin = self
+        self.base_url = "http://127.0.0.1:%d" % self._server.server_port
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.base_url
+
+    def Stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def GetStats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _FormatTime(val):
+    return val.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def Generate(recording, org, repos, items, seed=0):
+    """Records a synthetic org with repos repos, each with items issues, pulls (and their full objects) and commits.
+
+    The objects in the listings have every field GitHub lists, so that reading them doesn't request the full objects.
+    """
+    rand = random.Random(seed)
+    full_rand = random.Random(seed + 1)  # for the fields of full objects, the listings stay the same as without them
+    listed_rand = random.Random(seed + 2)  # likewise for the listed fields added later
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    words = ["fix", "crash", "add", "support", "parser", "layout", "flaky", "test", "docs", "memory", "leak", "renderer"]
+    users = [{"login": "user%d" % idx, "type": "User"} for idx in range(200)]
+    def Timestamp(days):
+        return now - datetime.timedelta(seconds=rand.randint(0, days * 86400))
+    def Sentence(count):
+        return " ".join(rand.choice(words) for _ in range(count))
+
+    org_url = "%s/orgs/%s" % (GITHUB_URL, org)
+    recording.Put("/orgs/" + org, {}, {"login": org, "id": 1, "name": org, "url": org_url,
+                                      "repos_url": org_url + "/repos", "type": "Organization"})
+    repo_list = []
+    for repo_idx in range(repos):
+        name = "repo%d" % repo_idx
+        repo_url = "%s/repos/%s/%s" % (GITHUB_URL, org, name)
+        html_url = "https://github.com/%s/%s" % (org, name)
+        created = Timestamp(3650)
+        repo = {"id": repo_idx + 1, "name": name, "full_name": "%s/%s" % (org, name), "owner": {"login": org, "type": "Organization"},
+                "url": repo_url, "html_url": html_url, "description": Sentence(6),
+                "language": rand.choice(["Rust", "Python", "C++", "JavaScript", None]), "fork": False, "private": False,
+                "stargazers_count": int(10 * (rand.paretovariate(1.2) - 1)), "watchers_count": rand.randint(0, 100),
+                "forks_count": rand.randint(0, 100), "open_issues_count": rand.randint(0, 100), "default_branch": "master",
+                "created_at": _FormatTime(created), "updated_at": _FormatTime(Timestamp(30)), "pushed_at": _FormatTime(Timestamp(30))}
+        repo.update((field, repo_url + path) for field, path in _REPO_URL_PATHS.items())
+        repo.update({"git_url": "git://github.com/%s/%s.git" % (org, name), "ssh_url": "git@github.com:%s/%s.git" % (org, name),
+                     "clone_url": html_url + ".git", "svn_url": html_url, "homepage": None, "mirror_url": None, "archived": False,
+                     "has_downloads": True, "has_issues": True, "has_projects": True, "has_wiki": True,
+                     "forks": repo["forks_count"], "open_issues": repo["open_issues_count"], "watchers": repo["watchers_count"],
+                     "size": listed_rand.randint(100, 100000), "permissions": {"admin": False, "push": False, "pull": True}})
+        recording.Put("/repos/%s/%s" % (org, name), {}, repo)
+        repo_list.append(repo)
+
+        issues, pulls, commits = [], [], []
+        for number in range(items, 0, -1):
+            created = Timestamp(365)
+            state = "open" if rand.random() < 0.3 else "closed"
+            closed = _FormatTime(created + datetime.timedelta(days=1)) if state == "closed" else None
+            base = {"id": repo_idx * items + number, "number": number, "title": Sentence(5), "state": state,
+                    "user": rand.choice(users), "body": Sentence(20), "created_at": _FormatTime(created),
+                    "updated_at": _FormatTime(created + datetime.timedelta(hours=rand.randint(0, 24))), "closed_at": closed,
+                    "labels": [{"name": label} for label in rand.sample(words, rand.randint(0, 2))],
+                    "assignee": None, "assignees": [], "milestone": None, "locked": False}
+            if listed_rand.random() < 0.3:
+                base.update(assignee=listed_rand.choice(users))
+                base.update(assignees=[base["assignee"]])
+            issue_url = "%s/issues/%d" % (repo_url, number)
+            issues.append(dict(base, url=issue_url, comments=rand.randint(0, 30), html_url="%s/issues/%d" % (html_url, number),
+                               comments_url=issue_url + "/comments", events_url=issue_url + "/events",
+                               labels_url=issue_url + "/labels{/name}", active_lock_reason=None, pull_request=None))
+            pull_url = "%s/pulls/%d" % (repo_url, number)
+            pull_html_url = "%s/pull/%d" % (html_url, number)
+            pulls.append(dict(base, url=pull_url, head={"ref": "branch%d" % number},
+                              base={"ref": "master"}, merged_at=closed, merge_commit_sha=None,
+                              html_url=pull_html_url, diff_url=pull_html_url + ".diff", patch_url=pull_html_url + ".patch",
+                              issue_url=issue_url, comments_url=issue_url + "/comments", commits_url=pull_url + "/commits",
+                              review_comments_url=pull_url + "/comments", review_comment_url=repo_url + "/pulls/comments{/number}"))
+            recording.Put("/repos/%s/%s/pulls/%d" % (org, name, number), {},  # the full object, with the fields lists leave out
+                          dict(pulls[-1], additions=full_rand.randint(0, 500), deletions=full_rand.randint(0, 500), changed_files=full_rand.randint(1, 20),
+                               commits=full_rand.randint(1, 10), comments=full_rand.randint(0, 30), review_comments=full_rand.randint(0, 10),
+                               merged=closed is not None, mergeable=full_rand.random() < 0.8 if state == "open" else None,
+                               mergeable_state="clean", merged_by=full_rand.choice(users) if closed else None))
+            sha = "%040x" % rand.getrandbits(160)
+            author = rand.choice(users)
+            date = _FormatTime(created)
+            commits.append({"sha": sha, "url": "%s/commits/%s" % (repo_url, sha), "html_url": "%s/commit/%s" % (html_url, sha),
+                            "author": author, "committer": author,
+                            "parents": [{"sha": "%040x" % rand.getrandbits(160)}],
+                            "commit": {"message": Sentence(8), "url": "%s/git/commits/%s" % (repo_url, sha),
+                                       "author": {"name": author["login"], "email": "", "date": date},
+                                       "committer": {"name": author["login"], "email": "", "date": date},
+                                       "tree": {"sha": sha, "url": "%s/git/trees/%s" % (repo_url, sha)}}})
+        issues.sort(key=lambda item: item["created_at"], reverse=True)
+        commits.sort(key=lambda item: item["commit"]["committer"]["date"], reverse=True)
+        recording.Put("/repos/%s/%s/issues" % (org, name), {"state": "all"}, issues)
+        recording.Put("/repos/%s/%s/pulls" % (org, name), {"state": "all"}, pulls)
+        recording.Put("/repos/%s/%s/commits" % (org, name), {}, commits)
+    recording.Put("/orgs/%s/repos" % org, {}, repo_list)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--recording", required=True, help="directory of the recorded responses")
+    arg_parser.add_argument("--generate", metavar="ORG", help="record a synthetic org and exit")
+    arg_parser.add_argument("--repos", type=int, default=8, help="repos of the synthetic org")
+    arg_parser.add_argument("--items", type=int, default=1000, help="issues, pulls and commits of each synthetic repo")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="the latency varies by up to this fraction")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of the requests failed")
+    arg_parser.add_argument("--error-status", type=int, default=502, help="status of the failed requests (403/429 are secondary rate limits)")
+    arg_parser.add_argument("--quota", type=int, help="requests allowed per quota window")
+    arg_parser.add_argument("--quota-window", type=int, default=3600, help="seconds")
+    arg_parser.add_argument("--record-from", metavar="URL", help="record what wasn't recorded from there, eg. " + GITHUB_URL)
+    arg_parser.add_argument("--token", help="token for --record-from")
+    args = arg_parser.parse_args()
+
+    recording = SgRecording(args.recording)
+    if args.generate:
+        Generate(recording, args.generate, args.repos, args.items)
+        sys.exit(0)
+    standin = SgGitHubStandIn(recording, args.latency, args.jitter, args.error_rate, args.error_status,
+                              args.quota, args.quota_window, args.record_from, args.token)
+    print("Serving %s on %s" % (args.recording, standin.Start(args.port)))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.Stop()
+        print(json.dumps(standin.GetStats(), indent=2))
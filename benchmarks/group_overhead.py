@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Measures the per-group overhead of evaluating expressions.
+
+Mimics what SgSession.Execute does after GROUP BY: the same HAVING, ORDER BY
+and SELECT expressions are evaluated once for every (small) group table.
+
+Sample Usage:
+    ./benchmarks/group_overhead.py --groups 5000 --rows 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from components import table as tb
+from components.expression import SgExpression
+
+EXPRS = [u"login",
+         u"count(login)",
+         u"sum(additions + deletions) / count(login)",
+         u"concat(login, \" (\", max(additions), \")\")",
+         u"count(login) > 2 and login like \"%bot%\""]
+
+
+def GenerateGroups(groups, rows):
+    tables = []
+    for g in range(groups):
+        table = tb.SgTable()
+        table.SetFields([u"login", u"additions", u"deletions"])
+        for r in range(rows):
+            table.Append([u"user%d" % g, g + r, r])
+        tables.append(table)
+    return tables
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--groups", type=int, default=5000, help="number of group tables")
+    arg_parser.add_argument("--rows", type=int, default=4, help="rows per group table")
+    args = arg_parser.parse_args()
+
+    tables = GenerateGroups(args.groups, args.rows)
+    start_time = time.time()
+    for table in tables:
+        for expr in EXPRS:
+            SgExpression.EvaluateExpression(table, expr)
+    exec_time = time.time() - start_time
+    print("groups: %d, rows per group: %d, expressions: %d" % (args.groups, args.rows, len(EXPRS)))
+    print("total: %.3fs, per group: %.1fus" % (exec_time, exec_time * 1e6 / args.groups))
@@ -3,6 +3,11 @@
 
 COMMAND_TOKENS = [u"select", u"from", u"where", u"group", u"having", u"order", u"limit"]
 EXIT_TOKENS = [u"exit", u"q"]
+STATEMENT_TOKENS = [u"set", u"refresh", u"explain", u"analyze"]
+SETTING_TOKENS = [u"fetch_concurrency"]
+SOURCE_OPTION_TOKENS = [u"with", u"max_staleness"]
+JOIN_TOKENS = [u"inner", u"join", u"as", u"on"]
+UNION_TOKENS = [u"union", u"all", u"distinct"]
 OPERATOR_TOKENS = [u"interval",
                    u"binary", u"collate",
                    u"!",
@@ -29,6 +34,11 @@ HORIZONTAL_FUNCTIONS = ["abs", "ceil", "ceiling", "exp", "floor", "greatest", "l
 
 ALL_TOKENS = (COMMAND_TOKENS +
               EXIT_TOKENS +
+              STATEMENT_TOKENS +
+              SETTING_TOKENS +
+              SOURCE_OPTION_TOKENS +
+              JOIN_TOKENS +
+              UNION_TOKENS +
               OPERATOR_TOKENS +
               AGGREGATE_FUNCTIONS +
               HORIZONTAL_FUNCTIONS)
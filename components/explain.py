@@ -0,0 +1,54 @@
+"""Measurements of the stages of a session, for EXPLAIN ANALYZE.
+
+Sample Usage:
+    explainer = SgExplainer(lambda: {"requests": scheduler.GetStats()["requests"]})
+    explainer.Begin(u"fetch")
+    table = fetcher.Fetch(u"abseil.repos")
+    explainer.End(len(table))
+    print(explainer.GetTable({u"fetch": u"abseil.repos"}))
+    print(GetPlanTable([(u"fetch", u"abseil.repos")]))
+"""
+
+import time
+
+import table as tb
+
+
+def GetPlanTable(plan):
+    """Returns the table of plan, a list of (stage, detail), for EXPLAIN."""
+    table = tb.SgTable()
+    table.SetFields([u"stage", u"detail"])
+    for stage, detail in plan:
+        table.Append([stage, detail])
+    return table
+
+
+class SgExplainer:
+    """Measurements of the stages of a session, for EXPLAIN ANALYZE."""
+
+    # counters of get_counters() reported per stage, in the order of the columns
+    COUNTERS = [u"requests", u"bytes", u"cache hits", u"rate limit used"]
+
+    def __init__(self, get_counters=None):
+        self._get_counters = get_counters or (lambda: {})  # returns the current (cumulative) value of COUNTERS
+        self._stages = []
+        self._current = None
+
+    def Begin(self, stage, rows_in=None):
+        self._current = (stage, rows_in, time.time(), self._get_counters())
+
+    def End(self, rows_out):
+        stage, rows_in, start_time, start_counters = self._current
+        counters = self._get_counters()
+        self._stages.append([stage, time.time() - start_time, rows_in, rows_out] +
+                            [counters.get(counter, 0) - start_counters.get(counter, 0) for counter in self.COUNTERS])
+        self._current = None
+
+    def GetTable(self, plan):
+        """Returns the measured stages with their details in plan ({stage: detail})."""
+        table = tb.SgTable()
+        table.SetFields([u"stage", u"detail", u"time (s)", u"rows in", u"rows out"] + self.COUNTERS)
+        for stage in self._stages:
+            table.Append([stage[0], plan.get(stage[0], u""), round(stage[1], 3)] +
+                         [val if val is not None else u"" for val in stage[2:]])
+        return table
@@ -47,6 +47,8 @@ Sample Usage:
     print(SgExpression.EvaluateExpression(table, u"CONCAT(\"a\", c, \"ccc\", -7 + 8)"))
 """
 
+import itertools
+import operator
 import re
 import regex  # need recursive pattern
 
@@ -55,6 +57,21 @@ import utilities as util
 import table as tb
 import math
 import datetime
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional, columns are evaluated with plain Python lists without it
+    np = None
+
+
+class _ConstantColumn(list):
+    """A column holding the same literal value in every row."""
+
+    def __init__(self, value, rows):
+        list.__init__(self, [value] * rows)
+        self.value = value
+
 
 class SgExpression:
     """A set of utility functions to evaluate expressions."""
@@ -62,12 +79,82 @@ class SgExpression:
     # (?:something) means a non-capturing group
     # Matches anything word that isn't postfixed with a '(' (not a function name)
     # Adding a non-alpha character as matching postfix to prevent cases like 'www(' having a match 'ww'
-    _TOKEN_BODY = r"([a-zA-Z_]+)"
-    _TOKEN_POST = r"(?:[^\(a-zA-Z_]|$)"
+    # A field may be qualified with the alias of its source (eg. "pulls.title" in a join)
+    _TOKEN_BODY = r"([a-zA-Z_]+(?:\.[a-zA-Z_]+)?)"
+    _TOKEN_POST = r"(?:[^\(a-zA-Z_.]|$)"
     _TOKEN_REGEX = _TOKEN_BODY + _TOKEN_POST
     _DBL_STR_REGEX = r"\"(?:[^\\\"]|\\.)*\""
     _SGL_STR_REGEX = r"\'(?:[^\\\']|\\.)*\'"
 
+    # Instructions of a compiled expression (a postfix program of (inst, arg) pairs)
+    _PUSH_VALUE = 0  # arg = literal value
+    _PUSH_FIELD = 1  # arg = field name
+    _APPLY_OPERATOR = 2  # arg = operator
+    _APPLY_FUNCTION = 3  # arg = function name
+    _START_LIST = 4  # wraps the top operand in a list (first item of a comma-separated list)
+    _APPLY_MATCHER = 5  # arg = matcher of a constant LIKE / REGEXP pattern
+
+    _compiled = util.LruCache(1024)  # expression text -> compiled program
+    _matchers = util.LruCache(256)  # (operator, pattern) -> matcher
+
+    # Binary operators evaluated column by column (the ones without a function are special-cased)
+    _BINARY_OPERATORS = {u",": None,
+                         u"*": operator.mul,
+                         u"/": operator.div,
+                         u"%": operator.mod,
+                         u"+": operator.add,
+                         u"-": operator.sub,
+                         u"==": operator.eq,  # shouldn't work with None but it does atm
+                         u">=": operator.ge,
+                         u">": operator.gt,
+                         u"<=": operator.le,
+                         u"<": operator.lt,
+                         u"<>": operator.ne,
+                         u"!=": operator.ne,
+                         u"is": operator.eq,
+                         u"like": None,
+                         u"regexp": None,
+                         u"in": lambda val, vals: val in vals,
+                         u"and": None, u"&&": None,
+                         u"xor": operator.ne,  # assumes both are boolean's
+                         u"or": None, u"||": None}
+
+    # Operators evaluated with NumPy for columns of int's or float's / bool's (if NumPy is installed)
+    _NUMPY_NUMERIC_OPERATORS = {u"*": "multiply",
+                                u"/": "divide",
+                                u"%": "mod",
+                                u"+": "add",
+                                u"-": "subtract",
+                                u"==": "equal",
+                                u">=": "greater_equal",
+                                u">": "greater",
+                                u"<=": "less_equal",
+                                u"<": "less",
+                                u"<>": "not_equal",
+                                u"!=": "not_equal",
+                                u"is": "equal"}
+    _NUMPY_BOOLEAN_OPERATORS = {u"and": "logical_and", u"&&": "logical_and",
+                                u"xor": "not_equal",
+                                u"or": "logical_or", u"||": "logical_or"}
+    _NUMPY_MIN_ROWS = 1000  # converting smaller columns costs more than it saves
+
+    _AND_OPERATORS = (u"and", u"&&")
+    _OR_OPERATORS = (u"or", u"||")
+
+    # Estimated fraction of the rows meeting a comparison (for ordering the terms of and / or)
+    _SELECTIVITIES = {u"==": 0.1, u"is": 0.1,
+                      u"in": 0.25, u"like": 0.25, u"regexp": 0.25,
+                      u"<": 0.33, u"<=": 0.33, u">": 0.33, u">=": 0.33,
+                      u"<>": 0.9, u"!=": 0.9}
+    _DEFAULT_SELECTIVITY = 0.5
+    _SHORT_CIRCUIT_COST = 8  # terms of and / or costing less are evaluated together on the same rows
+
+    _timer = None  # timer(expression, seconds) called after every evaluation if set (profiling)
+
+    @classmethod
+    def SetTimer(cls, timer):
+        cls._timer = timer
+
     @classmethod
     def ExtractTokensFromExpressions(cls, exprs):
         ret_set = set()
@@ -113,117 +200,172 @@ class SgExpression:
         return df.PRECEDENCE[opr] if opr else -100
 
     @classmethod
-    def _EvaluateOperatorBack(cls, opds, oprs):
-        opr = oprs[-1]
-        oprs.pop()
-        rows = len(opds)
-        if opr == u",":  # special case: have to process every u","
-            for i in range(rows):
-                opds[i] = opds[i][:-2] + [opds[i][-2] + [opds[i][-1]]]
-        elif opr == u"*":
-            for i in range(rows):
-                res = opds[i][-2] * opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"/":
-            for i in range(rows):
-                res = opds[i][-2] / opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"%":
-            for i in range(rows):
-                res = opds[i][-2] % opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"+":
-            for i in range(rows):
-                res = opds[i][-2] + opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"-":
-            for i in range(rows):
-                res = opds[i][-2] - opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"==":  # shouldn't work with None but it does atm
-            for i in range(rows):
-                res = opds[i][-2] == opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u">=":
-            for i in range(rows):
-                res = opds[i][-2] >= opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u">":
-            for i in range(rows):
-                res = opds[i][-2] > opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"<=":
-            for i in range(rows):
-                res = opds[i][-2] <= opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"<":
-            for i in range(rows):
-                res = opds[i][-2] < opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"<>":
-            for i in range(rows):
-                res = opds[i][-2] != opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"!=":
-            for i in range(rows):
-                res = opds[i][-2] != opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"is":
-            for i in range(rows):
-                res = opds[i][-2] == opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"like":
-            for i in range(rows):
+    def _ToArray(cls, vals, kinds):
+        """Returns vals as a NumPy array if NumPy is available and its dtype is of one of the kinds.
+
+        A list has to hold values of a single type of int, float or bool: NumPy would
+        convert a mix (eg. 3 / 2 would become 3.0 / 2, True would become 1).
+        """
+        if np is None:
+            return None
+        if isinstance(vals, np.ndarray):
+            arr = vals
+        elif isinstance(vals, _ConstantColumn):
+            arr = np.array(vals.value)  # broadcast as a scalar
+        elif len(vals) < cls._NUMPY_MIN_ROWS or type(vals[0]) not in (int, float, bool):
+            return None
+        elif len(set(map(type, vals))) != 1:
+            return None
+        else:
+            arr = np.array(vals)
+        return arr if arr.dtype.kind in kinds else None
+
+    @classmethod
+    def _ToList(cls, vals):
+        return vals.tolist() if np is not None and isinstance(vals, np.ndarray) else vals
+
+    @classmethod
+    def _EvaluateNumpyOperator(cls, opr, left, right):
+        """Evaluates a binary operator on two columns with NumPy, returns None if it can't be done."""
+        if opr in cls._NUMPY_NUMERIC_OPERATORS:
+            func = cls._NUMPY_NUMERIC_OPERATORS[opr]
+            kinds = (u"i", u"f")
+        elif opr in cls._NUMPY_BOOLEAN_OPERATORS:
+            func = cls._NUMPY_BOOLEAN_OPERATORS[opr]
+            kinds = (u"b",)
+        else:
+            return None
+        left_arr = cls._ToArray(left, kinds)
+        if left_arr is None:
+            return None
+        right_arr = cls._ToArray(right, kinds)
+        if right_arr is None or (left_arr.ndim == 0 and right_arr.ndim == 0):
+            return None
+        if opr in (u"/", u"%") and not right_arr.all():
+            return None  # leave it to Python to raise ZeroDivisionError
+        if opr in (u"*", u"+", u"-") and left_arr.dtype.kind == "i" and right_arr.dtype.kind == "i":
+            left_max = int(np.abs(left_arr).max())
+            right_max = int(np.abs(right_arr).max())
+            bound = left_max * right_max if opr == u"*" else left_max + right_max
+            if bound >= 2 ** 63:  # Python would promote the results to long
+                return None
+        return getattr(np, func)(left_arr, right_arr)
+
+    @classmethod
+    def _ParseLikePattern(cls, pattern):
+        """Splits a LIKE pattern into (wildcard, literal) pairs, wildcard being u"%", u"_" or None."""
+        parts = []
+        is_escaping = False
+        literal = u""
+        for ch in pattern:
+            if is_escaping:  # \% \_
+                literal += ch
                 is_escaping = False
-                regex = r""
-                for ch in opds[i][-1]:
-                    if is_escaping:  # \% \_
-                        regex += ch
-                        is_escaping = False
-                    elif ch == "\\":
-                        is_escaping = True
-                    elif ch == "%":
-                        regex += ".*"
-                    elif ch == "_":
-                        regex += "."
-                    else:
-                        regex += re.escape(ch)
-                regex += r"$"
-                res = True if opds[i][-2] and re.match(regex, opds[i][-2]) else False
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"regexp":
-            for i in range(rows):
-                regex = re.compile(opds[i][-1] + "$")
-                res = True if opds[i][-2] and re.match(regex, opds[i][-2]) else False
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"in":
-            for i in range(rows):
-                res = opds[i][-2] in opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == u"not":
-            for i in range(rows):
-                opds[i][-1] = not opds[i][-1]
+            elif ch == "\\":
+                is_escaping = True
+            elif ch in (u"%", u"_"):
+                if literal:
+                    parts.append((None, literal))
+                    literal = u""
+                parts.append((ch, None))
+            else:
+                literal += ch
+        if literal:
+            parts.append((None, literal))
+        return parts
+
+    @classmethod
+    def _BuildLikeMatcher(cls, pattern):
+        parts = cls._ParseLikePattern(pattern)
+        wildcards = [wildcard for wildcard, _ in parts if wildcard]
+        literals = [literal for _, literal in parts if literal]
+        # fast paths: "abc", "abc%", "%abc", "%abc%" and "%"
+        if not wildcards:
+            literal = literals[0] if literals else u""
+            return lambda val: val == literal
+        if u"_" not in wildcards and len(literals) <= 1:
+            if not literals:
+                return lambda val: True
+            literal = literals[0]
+            if parts[0][0] and parts[-1][0]:
+                return lambda val: literal in val
+            elif parts[-1][0]:
+                return lambda val: val.startswith(literal)
+            elif parts[0][0]:
+                return lambda val: val.endswith(literal)
+        regex = r""
+        for wildcard, literal in parts:
+            if wildcard == u"%":
+                regex += r".*"
+            elif wildcard == u"_":
+                regex += r"."
+            else:
+                regex += re.escape(literal)
+        return re.compile(regex + r"\Z", re.DOTALL).match
+
+    @classmethod
+    def _BuildRegexpMatcher(cls, pattern):
+        return re.compile(pattern + "$").match
+
+    @classmethod
+    def _GetMatcher(cls, opr, pattern):
+        """Returns a function matching values against a LIKE / REGEXP pattern (cached)."""
+        key = (opr, pattern)
+        matcher = cls._matchers.Get(key)
+        if matcher is None:
+            matcher = cls._BuildLikeMatcher(pattern) if opr == u"like" else cls._BuildRegexpMatcher(pattern)
+            cls._matchers.Put(key, matcher)
+        return matcher
+
+    @classmethod
+    def _EvaluateMatcher(cls, vals, matcher):
+        return [True if val and matcher(val) else False for val in cls._ToList(vals)]
+
+    @classmethod
+    def _EvaluateOperatorBack(cls, opds, opr):
+        """Evaluates an operator on the column(s) at the top of the operand stack."""
+        if opr == u"not":
+            arr = cls._ToArray(opds[-1], (u"b",))
+            if arr is not None and arr.ndim:
+                opds[-1] = np.logical_not(arr)
+            else:
+                opds[-1] = [not val for val in cls._ToList(opds[-1])]
+            return
+        elif opr not in cls._BINARY_OPERATORS:
+            return
+        right = opds.pop()
+        left = opds.pop()
+        res = cls._EvaluateNumpyOperator(opr, left, right)
+        if res is not None:
+            opds.append(res)
+            return
+        left = cls._ToList(left)
+        right = cls._ToList(right)
+        if opr == u",":  # special case: have to process every u","
+            res = [vals + [val] for vals, val in itertools.izip(left, right)]
+        elif opr in (u"like", u"regexp"):
+            matchers = {}  # saves a trip to the shared LRU for every row
+            res = []
+            for val, pattern in itertools.izip(left, right):
+                if pattern not in matchers:
+                    matchers[pattern] = cls._GetMatcher(opr, pattern)
+                res.append(True if val and matchers[pattern](val) else False)
         elif opr in (u"and", u"&&"):
-            for i in range(rows):
-                res = opds[i][-2] and opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
-        elif opr == "xor":
-            for i in range(rows):
-                res = opds[i][-2] != opds[i][-1]  # assumes both are boolean's
-                opds[i] = opds[i][:-2] + [res]
+            res = [lval and rval for lval, rval in itertools.izip(left, right)]
         elif opr in (u"or", u"||"):
-            for i in range(rows):
-                res = opds[i][-2] or opds[i][-1]
-                opds[i] = opds[i][:-2] + [res]
+            res = [lval or rval for lval, rval in itertools.izip(left, right)]
+        else:
+            res = map(cls._BINARY_OPERATORS[opr], left, right)
+        opds.append(res)
 
     @classmethod
-    def _EvaluateFunction(cls, opds, func):
+    def _EvaluateFunction(cls, vals, func):
         # TODO(lnishan): Add new function names to definitions.py
-        rows = len(opds)
+        rows = len(vals)
         if func == "zero":  # dummy function
             return [0] * rows
         if func == "avg":
-            avg = sum(row[-1] for row in opds) / float(rows)
+            avg = sum(vals) / float(rows)
             res = []
             for i in range(rows):
                 res.append(avg)
@@ -234,53 +376,53 @@ class SgExpression:
                 res.append(rows)
             return res
         elif func == "max":
-            mx = max(row[-1] for row in opds)
+            mx = max(vals)
             res = []
             for i in range(rows):
                 res.append(mx)
             return res
         elif func == "min":
-            mn = min(row[-1] for row in opds)
+            mn = min(vals)
             res = []
             for i in range(rows):
                 res.append(mn)
             return res
         elif func == "sum":
-            sm = sum(row[-1] for row in opds)
+            sm = sum(vals)
             res = []
             for i in range(rows):
                 res.append(sm)
             return res
         elif func == "ascii":
             res = []
-            for row in opds:
-                res.append(u" ".join(str(ord(i)) for i in row[-1]))
+            for val in vals:
+                res.append(u" ".join(str(ord(i)) for i in val))
             return res
         elif func == "concat":
             res = []
-            for row in opds:
+            for args in vals:
                 cstr = u""
-                for val in row[-1]:
+                for val in args:
                     cstr += util.GuaranteeUnicode(val)
                 res.append(cstr)
             return res
         elif func == "concat_ws":
             res = []
-            for row in opds:
+            for args in vals:
                 cstr = u""
-                sep = row[-1][0]
-                for val in row[-1][:-1]:
+                sep = args[0]
+                for val in args[:-1]:
                     if val != sep:
                         cstr += util.GuaranteeUnicode(val)
                         cstr += sep
-                cstr += util.GuaranteeUnicode(row[-1][-1])
+                cstr += util.GuaranteeUnicode(args[-1])
                 res.append(cstr)
             return res
         elif func == "find_in_set":
             res =[]
-            for row in opds:
-                cstr = row[-1][-1]
-                subs = row[-1][-2]
+            for val in vals:
+                cstr = val[-1]
+                subs = val[-2]
                 if subs in cstr:
                     res.append(cstr.index(subs)+1)
                 else:
@@ -288,43 +430,43 @@ class SgExpression:
             return res
         elif func == "insert":
             res = []
-            for row in opds:
-                x = row[-1][-3] - 1
-                y = row[-1][-2]
-                str = row[-1][-4]
-                subs = row[-1][-1]
+            for val in vals:
+                x = val[-3] - 1
+                y = val[-2]
+                str = val[-4]
+                subs = val[-1]
                 res.append(str[:x] + subs + str[x+y-1:])
             return res
         elif func == "instr":
             res = []
-            for row in opds:
-                res.append(row[-1][-2].find(row[-1][-1])+1)
+            for val in vals:
+                res.append(val[-2].find(val[-1])+1)
             return res
         elif func in (u"lcase", u"lower"):
             res = []
-            for row in opds:
-	        res.append(row[-1].lower())
+            for val in vals:
+                res.append(val.lower())
             return res
         elif func == "left":
             res = []
-            for row in opds:
-                n_char = row[-1][-1]
-                subs = row[-1][-2]
+            for val in vals:
+                n_char = val[-1]
+                subs = val[-2]
                 res.append(subs[:n_char])
             return res
         elif func == "length":
             res = []
-            for row in opds:
-                res.append(len(row[-1]))
+            for val in vals:
+                res.append(len(val))
             return res
         elif func == "locate":
             res = []
-            for row in opds:
-                x = len(row[-1])
+            for val in vals:
+                x = len(val)
                 if x == 3:
-                    st_pos = row[-1].pop()
-                cstr = row[-1].pop()
-                subs = row[-1].pop()
+                    st_pos = val.pop()
+                cstr = val.pop()
+                subs = val.pop()
                 if x == 3:
                     res.append(cstr.find(subs, st_pos)+1)
                 else:
@@ -332,12 +474,12 @@ class SgExpression:
             return res
         elif func in (u"mid", u"substr", u"substring"):
             res = []
-            for row in opds:
-                x = len(row[-1])
+            for val in vals:
+                x = len(val)
                 if x == 3:
-                    n_len = row[-1].pop()
-                n_st = row[-1].pop() - 1
-                subs = row[-1].pop()
+                    n_len = val.pop()
+                n_st = val.pop() - 1
+                subs = val.pop()
                 if x == 3:
                     n_end = n_st + n_len
                     res.append(subs[n_st:n_end]) 
@@ -346,158 +488,158 @@ class SgExpression:
             return res 
         elif func == "repeat":
             res = []
-            for row in opds:
+            for val in vals:
                 cstr = u""
-                for i in range(row[-1][-1]):
-                    cstr += row[-1][-2]
+                for i in range(val[-1]):
+                    cstr += val[-2]
                 res.append(cstr)
             return res
         elif func == "replace":
             res = []
-            for row in opds:
-                res.append(row[-1][-3].replace(row[-1][-2],row[-1][-1]))
+            for val in vals:
+                res.append(val[-3].replace(val[-2],val[-1]))
             return res  
         elif func == "right":
             res = []
-            for row in opds:
-                n_char = row[-1][-1]
-                subs = row[-1][-2]
+            for val in vals:
+                n_char = val[-1]
+                subs = val[-2]
                 res.append(subs[-n_char:])
             return res
         elif func == "strcmp":
             res = []
-            for row in opds:
-                res.append((row[-1][-1] == row[-1][-2]))
+            for val in vals:
+                res.append((val[-1] == val[-2]))
             return res
         elif func in (u"ucase", u"upper"):
             res = []
-            for row in opds:
-                res.append(row[-1].upper())
+            for val in vals:
+                res.append(val.upper())
             return res
         elif func == "abs":
             res = []
-            for row in opds:
-                res.append(abs(row[-1]))
+            for val in vals:
+                res.append(abs(val))
             return res
         elif func in (u"ceil", u"ceiling"):
             res = []
-            for row in opds:
-                res.append(math.ceil(row[-1]))
+            for val in vals:
+                res.append(math.ceil(val))
             return res
         elif func == "exp":
             res = []
-            for row in opds:
-                res.append(math.exp(row[-1]))
-                return res
+            for val in vals:
+                res.append(math.exp(val))
+            return res
         elif func == "floor":
             res = []
-            for row in opds:
-                res.append(math.floor(row[-1]))
-                return res
+            for val in vals:
+                res.append(math.floor(val))
+            return res
         elif func == "greatest":
             res = []
-            for row in opds:
-                res.append(max(row[-1]))
+            for val in vals:
+                res.append(max(val))
             return res
         elif func == "least":
             res = []
-            for row in opds:
-                res.append(min(row[-1]))
+            for val in vals:
+                res.append(min(val))
             return res  
         elif func in (u"ln", u"log"):
             res = []
-            for row in opds:
-                res.append(math.log(row[-1]))
+            for val in vals:
+                res.append(math.log(val))
             return res
         elif func in (u"pow", u"power"):
             res = []
-            for row in opds:
-                res.append(math.pow(row[-1][-2], row[-1][-1]))
+            for val in vals:
+                res.append(math.pow(val[-2], val[-1]))
             return res
         elif func == "sign":
             res = []
-            for row in opds:
-                res.append((row[-1] > 0) - (row[-1] < 0))
+            for val in vals:
+                res.append((val > 0) - (val < 0))
             return res
         elif func == "sqrt":
             res = []
-            for row in opds:
-                res.append(math.sqrt(row[-1]))
+            for val in vals:
+                res.append(math.sqrt(val))
             return res
         elif func in (u"curdate", u"current_date"):
             res = []
-            for row in opds:
+            for val in vals:
                 res.append(datetime.date.today().strftime('%Y-%m-%d'))
             return res
         elif func in (u"curtime", u"current_time"):
             res = []
-            for row in opds:
+            for val in vals:
                 res.append(datetime.datetime.now().strftime('%H:%M:%S'))
             return res
         elif func in (u"current_timestamp", u"local", u"localtimestamp", u"now"):
             res = []
-            for row in opds:
+            for val in vals:
                 res.append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
             return res
         elif func == "bin":
             res = []
-            for row in opds:
-                res.append(bin(row[-1])[2:])
+            for val in vals:
+                res.append(bin(val)[2:])
             return res
         else:
-            res = [row[-1] for row in opds]
+            res = list(vals)
             return res
 
     @classmethod
-    def _EvaluateOperator(cls, opds, oprs, opr=None):
+    def _EmitOperatorBack(cls, program, oprs):
+        opr = oprs.pop()
+        if opr in (u"like", u"regexp") and program and program[-1][0] == cls._PUSH_VALUE and isinstance(program[-1][1], basestring):
+            # constant pattern: build the matcher once, at compile time
+            pattern = program.pop()[1]
+            program.append((cls._APPLY_MATCHER, cls._GetMatcher(opr, pattern)))
+        else:
+            program.append((cls._APPLY_OPERATOR, opr))
+
+    @classmethod
+    def _EmitOperator(cls, program, oprs, opr=None):
         prec = cls._GetPrecedence(opr)
-        rows = len(opds)
         if opr == u"(":
             oprs.append(u"")
             oprs.append(opr)
         elif opr == u")":
             while oprs and oprs[-1] != u"(":
-                cls._EvaluateOperatorBack(opds, oprs)
+                cls._EmitOperatorBack(program, oprs)
             oprs.pop()
             func = oprs.pop().lower()
             if func:
-                res = cls._EvaluateFunction(opds, func)
-                for i in range(rows):
-                    opds[i][-1] = res[i]
+                program.append((cls._APPLY_FUNCTION, func))
         elif opr == u",":
             while oprs and cls._GetPrecedence(oprs[-1]) >= prec and oprs[-1] != ",":
-                cls._EvaluateOperatorBack(opds, oprs)
+                cls._EmitOperatorBack(program, oprs)
             if (not oprs) or (oprs and oprs[-1] != ","):
-                for i in range(rows):
-                    opds[i][-1] = [opds[i][-1]]
+                program.append((cls._START_LIST, None))
             else:
-                oprs.pop()
-                for i in range(rows):
-                    opds[i] = opds[i][:-2] + [opds[i][-2] + [opds[i][-1]]]
+                cls._EmitOperatorBack(program, oprs)
             oprs.append(opr)
         else:
             while oprs and cls._GetPrecedence(oprs[-1]) >= prec :
-                cls._EvaluateOperatorBack(opds, oprs)
+                cls._EmitOperatorBack(program, oprs)
             if opr:
                 oprs.append(opr)
 
     @classmethod
-    def _ProcessOperator(cls, is_start, opds, oprs, token):
-        rows = len(opds)
+    def _ProcessOperator(cls, is_start, program, oprs, token):
         token = token.lower()
         if token == u"-":
             token = u"--" if is_start else u"-"
         elif token == u"=":
             token = u"=="
-        cls._EvaluateOperator(opds, oprs, token)
+        cls._EmitOperator(program, oprs, token)
 
     @classmethod
-    def EvaluateExpression(cls, table, expr):
-        rows = len(table)
-        opds = []
+    def _Compile(cls, expr):
+        program = []
         oprs = []
-        for _ in range(rows):
-            opds.append([])
         reading = None  # None = nothing, 0 = operator, 1 = field tokens (can be operator too), 2 = number, 3 = string
         is_start = True
         is_escaping = False
@@ -513,8 +655,7 @@ class SgExpression:
                 elif ch == "\\":
                     is_escaping = True
                 elif ch == string_ch:
-                    for i in range(rows):
-                        opds[i].append(token)
+                    program.append((cls._PUSH_VALUE, token))
                     token = u""
                     string_ch = None
                     reading = None
@@ -525,8 +666,7 @@ class SgExpression:
                     token += ch
                 else:
                     num = float(token) if u"." in token else int(token)
-                    for i in range(rows):
-                        opds[i].append(num)
+                    program.append((cls._PUSH_VALUE, num))
                     token = u""
                     if cls._IsOperatorCharacter(ch):
                         reading = 0
@@ -536,11 +676,11 @@ class SgExpression:
                     else:
                         reading = None
             elif reading == 1:
-                if cls._IsFieldTokenCharacter(ch):
+                if cls._IsFieldTokenCharacter(ch) or (ch == u"." and u"." not in token and cls._IsFieldTokenCharacter(expr[idx + 1])):
                     token += ch
                 else:
                     if token.lower() in df.OPERATOR_TOKENS:
-                        cls._ProcessOperator(is_start, opds, oprs, token)
+                        cls._ProcessOperator(is_start, program, oprs, token)
                         token = u""
                         if ch.isspace():
                             reading = None
@@ -565,15 +705,12 @@ class SgExpression:
                         while idx2 < len(expr) and expr[idx2] == u" ":
                             idx2 = idx2 + 1
                         if idx2 < len(expr) and expr[idx2] == u")":
-                            for i in range(rows):
-                                opds[i].append(None)
+                            program.append((cls._PUSH_VALUE, None))
                         is_start = True
                         token = u""
                         reading = None
                     else:
-                        vals = table.GetVals(token)
-                        for i in range(rows):
-                            opds[i].append(vals[i])
+                        program.append((cls._PUSH_FIELD, token))
                         token = u""
                         if cls._IsOperatorCharacter(ch):
                             reading = 0
@@ -597,7 +734,7 @@ class SgExpression:
                 if is_opr:
                     token += ch
                 else:
-                    cls._ProcessOperator(is_start, opds, oprs, token)
+                    cls._ProcessOperator(is_start, program, oprs, token)
                     token = u""
                     if ch.isspace():
                         reading = None
@@ -631,19 +768,290 @@ class SgExpression:
                     elif cls._IsOperatorCharacter(ch):
                         reading = 0
                     is_start = ch in (u"(", u",")
-        cls._EvaluateOperator(opds, oprs)  # opr = None
-        return [row[0] for row in opds]
+        cls._EmitOperator(program, oprs)  # opr = None
+        return program
+
+    @classmethod
+    def Compile(cls, expr):
+        """Compiles an expression into a postfix program (cached by expression text)."""
+        program = cls._compiled.Get(expr)
+        if program is None:
+            program = cls._Compile(expr)
+            cls._compiled.Put(expr, program)
+        return program
+
+    @classmethod
+    def CompileAggregation(cls, expr, aggregates):
+        """Compiles expr into a program reading the result of each aggregate function call in it from a field.
+
+        The (function, argument program) of every call is added to aggregates (if not in it yet),
+        its result is read from field u"#i", i being its index in aggregates.
+        Returns (program, fields referenced outside of aggregate functions), or None if calls are nested.
+        """
+        program = []
+        fields = []
+        starts = []  # where each operand on the stack starts in program
+        for inst, arg in cls.Compile(expr):
+            if inst in (cls._PUSH_VALUE, cls._PUSH_FIELD):
+                starts.append(len(program))
+            elif inst == cls._APPLY_OPERATOR and arg in cls._BINARY_OPERATORS:
+                if len(starts) < 2:
+                    return None
+                starts.pop()
+            elif inst == cls._APPLY_FUNCTION and arg in df.AGGREGATE_FUNCTIONS:
+                aggregate = (arg, program[starts[-1]:])
+                if any(arg_inst == cls._PUSH_FIELD and arg_field.startswith(u"#") for arg_inst, arg_field in aggregate[1]):
+                    return None
+                del program[starts[-1]:]
+                if aggregate not in aggregates:
+                    aggregates.append(aggregate)
+                inst, arg = cls._PUSH_FIELD, u"#%d" % aggregates.index(aggregate)
+            program.append((inst, arg))
+        for inst, arg in program:
+            if inst == cls._PUSH_FIELD and not arg.startswith(u"#") and arg not in fields:
+                fields.append(arg)
+        return program, fields
+
+    @classmethod
+    def _BuildTree(cls, program):
+        """Folds a compiled program into a tree of (inst, arg, children) nodes."""
+        nodes = []
+        for inst, arg in program:
+            if inst in (cls._PUSH_VALUE, cls._PUSH_FIELD):
+                nodes.append((inst, arg, []))
+            elif inst == cls._APPLY_OPERATOR and arg in cls._BINARY_OPERATORS:
+                right = nodes.pop()
+                left = nodes.pop()
+                nodes.append((inst, arg, [left, right]))
+            elif inst != cls._APPLY_OPERATOR or arg == u"not":
+                nodes.append((inst, arg, [nodes.pop()]))
+        return nodes[0]
+
+    @classmethod
+    def _SplitConjuncts(cls, node):
+        inst, arg, children = node
+        if inst == cls._APPLY_OPERATOR and arg in (u"and", u"&&"):
+            return cls._SplitConjuncts(children[0]) + cls._SplitConjuncts(children[1])
+        return [node]
+
+    @classmethod
+    def ExtractComparisons(cls, expr):
+        """Returns the (field, operator, value) comparisons which expr requires to be true.
+
+        Only top-level conjuncts comparing a field with a literal are returned,
+        "literal in field" is returned as (field, u"contains", literal).
+        """
+        flipped = {u"==": u"==", u"<>": u"<>", u"!=": u"!=", u"is": u"is",
+                   u"<": u">", u"<=": u">=", u">": u"<", u">=": u"<="}
+        comparisons = []
+        for inst, opr, children in cls._SplitConjuncts(cls._BuildTree(cls.Compile(expr))):
+            if inst != cls._APPLY_OPERATOR or (opr not in flipped and opr != u"in"):
+                continue
+            (left_inst, left, _), (right_inst, right, _) = children
+            if left_inst == cls._PUSH_FIELD and right_inst == cls._PUSH_VALUE and opr != u"in":
+                comparisons.append((left, opr, right))
+            elif left_inst == cls._PUSH_VALUE and right_inst == cls._PUSH_FIELD:
+                comparisons.append((right, u"contains" if opr == u"in" else flipped[opr], left))
+        return comparisons
+
+    @classmethod
+    def _SplitOperands(cls, program):
+        """Returns the programs of both operands of the binary operator ending a compiled program."""
+        starts = []  # where each operand on the stack starts in program
+        for idx, (inst, arg) in enumerate(program[:-1]):
+            if inst in (cls._PUSH_VALUE, cls._PUSH_FIELD):
+                starts.append(idx)
+            elif inst == cls._APPLY_OPERATOR and arg in cls._BINARY_OPERATORS:
+                starts.pop()
+        return program[:starts[-1]], program[starts[-1]:-1]
+
+    @classmethod
+    def _SplitTerms(cls, program, oprs):
+        """Returns the programs of the top-level terms of a compiled program joined with one of oprs."""
+        inst, arg = program[-1]
+        if inst != cls._APPLY_OPERATOR or arg not in oprs:
+            return [program]
+        left, right = cls._SplitOperands(program)
+        return cls._SplitTerms(left, oprs) + cls._SplitTerms(right, oprs)
+
+    @classmethod
+    def SplitConjuncts(cls, program):
+        """Returns the programs of the top-level conjuncts of a compiled condition (it's true if they all are)."""
+        return cls._SplitTerms(program, cls._AND_OPERATORS)
+
+    @classmethod
+    def GetFields(cls, program):
+        """Returns the fields a compiled program reads."""
+        fields = []
+        for inst, arg in program:
+            if inst == cls._PUSH_FIELD and arg not in fields:
+                fields.append(arg)
+        return fields
+
+    @classmethod
+    def ExtractFieldEquality(cls, program):
+        """Returns (field, field) if a compiled program compares two fields for equality, None otherwise."""
+        if len(program) == 3 and program[0][0] == program[1][0] == cls._PUSH_FIELD and program[2] == (cls._APPLY_OPERATOR, u"=="):
+            return program[0][1], program[1][1]
+        return None
+
+    @classmethod
+    def _EstimateCost(cls, program):
+        """Returns the estimated cost per row of a compiled program, in units of a field read."""
+        cost = 0
+        for inst, arg in program:
+            if inst == cls._PUSH_FIELD or inst == cls._START_LIST:
+                cost += 1
+            elif inst == cls._APPLY_OPERATOR:
+                cost += 8 if arg in (u"like", u"regexp") else 1
+            elif inst == cls._APPLY_MATCHER:
+                cost += 8 if hasattr(arg, "__self__") else 2  # a compiled regex's match, or a fast path of like
+            elif inst == cls._APPLY_FUNCTION:
+                cost += 3
+        return cost
+
+    @classmethod
+    def _EstimateSelectivity(cls, program):
+        """Returns the estimated fraction of the rows meeting a compiled condition."""
+        inst, arg = program[-1]
+        if inst == cls._APPLY_OPERATOR and arg in cls._AND_OPERATORS:
+            return reduce(operator.mul, [cls._EstimateSelectivity(term) for term in cls._SplitTerms(program, cls._AND_OPERATORS)])
+        elif inst == cls._APPLY_OPERATOR and arg in cls._OR_OPERATORS:
+            return 1 - reduce(operator.mul, [1 - cls._EstimateSelectivity(term) for term in cls._SplitTerms(program, cls._OR_OPERATORS)])
+        elif inst == cls._APPLY_OPERATOR:
+            return cls._SELECTIVITIES.get(arg, cls._DEFAULT_SELECTIVITY)
+        elif inst == cls._APPLY_MATCHER:
+            return cls._SELECTIVITIES[u"like"]
+        return cls._DEFAULT_SELECTIVITY
+
+    @classmethod
+    def _OrderTerms(cls, terms, is_and):
+        """Orders the terms of and (or or) so that the cheap ones deciding the most rows come first."""
+        def Rank(term):
+            selectivity = cls._EstimateSelectivity(term)
+            decided = 1 - selectivity if is_and else selectivity  # fraction of the rows the term settles
+            return cls._EstimateCost(term) / max(decided, 0.01)
+        return sorted(terms, key=Rank)
+
+    @classmethod
+    def _Gather(cls, table, program, selection):
+        """Returns a table of the rows in selection (indices) with the fields a compiled program reads."""
+        if len(selection) == len(table):
+            return table
+        fields = cls.GetFields(program)
+        ret = tb.SgTable()
+        ret.SetFields(fields)
+        ret.SetCols([[vals[idx] for idx in selection] for vals in [table.GetVals(field) for field in fields]], len(selection))
+        return ret
+
+    @classmethod
+    def _ExecuteSelected(cls, program, table, selection):
+        """Returns whether each row in selection (indices) meets a compiled condition.
+
+        The terms of and / or are evaluated one after the other (the cheap ones
+        together), each one only on the rows the previous ones haven't decided:
+        for and, the ones meeting them all so far; for or, the ones meeting none
+        of them so far.
+        """
+        inst, arg = program[-1]
+        if inst != cls._APPLY_OPERATOR or arg not in cls._AND_OPERATORS + cls._OR_OPERATORS:
+            return cls._Execute(program, cls._Gather(table, program, selection))
+        is_and = arg in cls._AND_OPERATORS
+        terms = cls._OrderTerms(cls._SplitTerms(program, cls._AND_OPERATORS if is_and else cls._OR_OPERATORS), is_and)
+        # consecutive cheap terms are evaluated together, keeping track of the rows would cost more than it saves
+        groups = []
+        for term in terms:
+            is_cheap = cls._EstimateCost(term) < cls._SHORT_CIRCUIT_COST
+            if is_cheap and groups and groups[-1][0]:
+                groups[-1][1].append(term)
+            else:
+                groups.append((is_cheap, [term]))
+        if len(groups) == 1 and groups[0][0]:
+            return cls._Execute(program, cls._Gather(table, program, selection))
+        meets = [False] * len(selection)
+        positions = range(len(selection))  # of the undecided rows in selection
+        for _, group in groups:
+            if len(group) == 1:
+                vals = cls._ExecuteSelected(group[0], table, selection)
+            else:
+                group_program = reduce(lambda left, right: left + right + [(cls._APPLY_OPERATOR, arg)], group)
+                vals = cls._Execute(group_program, cls._Gather(table, group_program, selection))
+            if not is_and:
+                for pos, val in itertools.izip(positions, vals):
+                    if val:
+                        meets[pos] = True
+                vals = [not val for val in vals]
+            positions = list(itertools.compress(positions, vals))
+            selection = list(itertools.compress(selection, vals))
+            if not selection:
+                break
+        if is_and:
+            for pos in positions:
+                meets[pos] = True
+        return meets
+
+    @classmethod
+    def _ExecuteCondition(cls, program, table):
+        if any(inst == cls._APPLY_FUNCTION and arg in df.AGGREGATE_FUNCTIONS for inst, arg in program):
+            return cls._Execute(program, table)  # aggregates need every row
+        return cls._ExecuteSelected(program, table, range(len(table)))
+
+    @classmethod
+    def _Execute(cls, program, table):
+        rows = len(table)
+        opds = []  # a stack of columns
+        fields = {}
+        for inst, arg in program:
+            if inst == cls._PUSH_VALUE:
+                opds.append(_ConstantColumn(arg, rows))
+            elif inst == cls._PUSH_FIELD:
+                if arg not in fields:
+                    vals = table.GetVals(arg)
+                    arr = cls._ToArray(vals, (u"i", u"f", u"b"))
+                    fields[arg] = arr if arr is not None else vals
+                opds.append(fields[arg])
+            elif inst == cls._APPLY_OPERATOR:
+                cls._EvaluateOperatorBack(opds, arg)
+            elif inst == cls._APPLY_FUNCTION:
+                opds[-1] = cls._EvaluateFunction(cls._ToList(opds[-1]), arg)
+            elif inst == cls._START_LIST:
+                opds[-1] = [[val] for val in cls._ToList(opds[-1])]
+            elif inst == cls._APPLY_MATCHER:
+                opds[-1] = cls._EvaluateMatcher(opds[-1], arg)
+        return cls._ToList(opds[0])
+
+    @classmethod
+    def _TimedExecute(cls, program, table, label, execute=None):
+        execute = execute or cls._Execute
+        if cls._timer is None:
+            return execute(program, table)
+        start_time = time.time()
+        ret = execute(program, table)
+        cls._timer(label, time.time() - start_time)
+        return ret
+
+    @classmethod
+    def EvaluateExpression(cls, table, expr):
+        return cls._TimedExecute(cls.Compile(expr), table, expr)
+
+    @classmethod
+    def EvaluateProgram(cls, table, program, label=u"<compiled program>"):
+        """Evaluates a compiled program, label names it for the timer."""
+        return cls._TimedExecute(program, table, label)
+
+    @classmethod
+    def EvaluateCondition(cls, table, expr):
+        """Returns whether each row meets a condition (eg. of WHERE), short-circuiting and / or row by row."""
+        return cls._TimedExecute(cls.Compile(expr), table, expr, cls._ExecuteCondition)
+
+    @classmethod
+    def EvaluateConditionProgram(cls, table, program, label=u"<compiled program>"):
+        """Returns whether each row meets a compiled condition, label names it for the timer."""
+        return cls._TimedExecute(program, table, label, cls._ExecuteCondition)
 
     @classmethod
     def EvaluateExpressions(cls, table, exprs):
         ret = tb.SgTable()
         ret.SetFields(exprs)
-        rows = len(table)
-        for _ in range(rows):
-            ret.Append([])
-        for expr in exprs:
-            res = cls.EvaluateExpression(table, expr)
-            for i, val in enumerate(res):
-                # TODO(lnishan): Fix the cheat here.
-                ret._table[i].append(val)
+        ret.SetCols([cls.EvaluateExpression(table, expr) for expr in exprs], len(table))
         return ret
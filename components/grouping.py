@@ -1,6 +1,19 @@
-"""Group and generate a list of SgTable's."""
+"""Group and generate a list of SgTable's, or aggregate groups into rows."""
+
+import itertools
 
 import table as tb
+from expression import SgExpression
+
+
+_EMPTY = object()  # state of min / max before the first value
+
+# aggregate function -> (initial state, update(state, val), result(state))
+_ACCUMULATORS = {"avg": ((0, 0), lambda state, val: (state[0] + val, state[1] + 1), lambda state: state[0] / float(state[1])),
+                 "count": (0, lambda state, val: state + 1, lambda state: state),
+                 "max": (_EMPTY, lambda state, val: val if state is _EMPTY or val > state else state, lambda state: state),
+                 "min": (_EMPTY, lambda state, val: val if state is _EMPTY or val < state else state, lambda state: state),
+                 "sum": (0, lambda state, val: state + val, lambda state: state)}
 
 
 class SgGrouping:
@@ -17,3 +30,64 @@ class SgGrouping:
                 groups_dict[key].SetFields(table.GetFields()[:-num_groups])
             groups_dict[key].Append(row[:-num_groups])
         return groups_dict.values()
+
+
+class SgHashAggregation:
+    """Evaluates expressions once per group in a single pass, keeping only accumulator state for each group.
+
+    Fields referenced outside of aggregate functions take their values from the first row of a group,
+    so the result is exact when they're group expressions (see IsSupported).
+    """
+
+    def __init__(self, exprs, groups=None):
+        self._exprs = exprs
+        self._groups = groups or []
+        self._aggregates = []  # (function, argument program) of every aggregate function call
+        self._programs = []
+        self._fields = []  # fields referenced outside of aggregate functions
+        self._supported = True
+        for expr in exprs:
+            compiled = SgExpression.CompileAggregation(expr, self._aggregates)
+            if compiled is None:
+                self._supported = False
+                continue
+            program, fields = compiled
+            if expr not in self._groups and not set(fields) <= set(self._groups):
+                self._supported = False
+            self._programs.append(program)
+            self._fields += [field for field in fields if field not in self._fields]
+
+    def IsSupported(self):
+        """Whether every expression has the same value for all rows of a group."""
+        return self._supported
+
+    def Aggregate(self, table):
+        """Returns a table of the expressions, one row per group (in order of first appearance)."""
+        if self._groups:
+            keys = itertools.izip(*[SgExpression.EvaluateExpression(table, group) for group in self._groups])
+        else:
+            keys = itertools.repeat((), len(table))
+        accumulators = [_ACCUMULATORS[func] for func, _ in self._aggregates]
+        args = [SgExpression.EvaluateProgram(table, program, u"argument of %s" % func) for func, program in self._aggregates]
+        field_vals = [table.GetVals(field) for field in self._fields]
+        groups = {}  # key -> (field values of its first row, accumulator states)
+        keys_in_order = []
+        for idx, key in enumerate(keys):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = ([vals[idx] for vals in field_vals], [init for init, _, _ in accumulators])
+                keys_in_order.append(key)
+            states = group[1]
+            for i, (_, update, _) in enumerate(accumulators):
+                states[i] = update(states[i], args[i][idx])
+
+        group_table = tb.SgTable()
+        group_table.SetFields(self._fields + [u"#%d" % i for i in range(len(self._aggregates))])
+        for key in keys_in_order:
+            vals, states = groups[key]
+            group_table.Append(vals + [result(state) for (_, _, result), state in itertools.izip(accumulators, states)])
+        res_table = tb.SgTable()
+        res_table.SetFields(self._exprs)
+        columns = [SgExpression.EvaluateProgram(group_table, program, expr) for program, expr in itertools.izip(self._programs, self._exprs)]
+        res_table.SetCols(columns, len(group_table))
+        return res_table
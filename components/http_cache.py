@@ -0,0 +1,201 @@
+"""A persistent cache for GitHub API responses.
+
+GET responses are stored on disk with their ETag / Last-Modified headers.
+Within the TTL of their source type they are served without any request;
+after that they are revalidated with a conditional request (a 304 doesn't
+count against GitHub's rate limit).
+
+Sample Usage:
+    g = Github(token)
+    cache = SgHttpCache("http_cache")
+    cache.Install(g)
+    print(g.get_organization("abseil").name)
+    print(cache.GetStats())
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib
+import urlparse
+
+
+class SgHttpCache:
+    """A persistent cache for GitHub API responses."""
+
+    DEFAULT_TTLS = {"repos": 3600,
+                    "issues": 300,
+                    "pulls": 300,
+                    "commits": 600,
+                    "default": 3600}  # in seconds
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # in bytes
+
+    _KEY_HEADERS = ("accept",)  # request headers the response depends on (eg. preview media types)
+
+    def __init__(self, directory, ttls=None, max_size=DEFAULT_MAX_SIZE, namespace=u""):
+        self._directory = directory
+        self._ttls = dict(self.DEFAULT_TTLS)
+        self._ttls.update(ttls or {})
+        self._max_size = max_size
+        self._namespace = namespace  # eg. a hash of the token, responses depend on who asks
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        self._listeners = []  # called with (org, source type) when a cached response changes
+        self._expired = {}  # (org, source type) -> responses fetched before this time are revalidated
+        self._index = {}  # file name -> [size, last access time]
+        self._size = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(directory, name))
+                self._index[name] = [stat.st_size, stat.st_mtime]
+                self._size += stat.st_size
+        with self._lock:
+            self._Evict()
+
+    def _GetSourceType(self, url):
+        segments = [segment for segment in urlparse.urlparse(url).path.split("/") if segment]
+        for source_type in ("issues", "pulls", "commits"):
+            if source_type in segments:
+                return source_type
+        if segments and segments[-1] == "repos":
+            return "repos"
+        return "default"
+
+    def _GetOrg(self, url):
+        segments = [segment for segment in urlparse.urlparse(url).path.split("/") if segment]
+        for idx, segment in enumerate(segments[:-1]):
+            if segment in ("orgs", "repos"):
+                return segments[idx + 1].lower()
+        return None
+
+    def _GetFileName(self, url, parameters, headers=None):
+        key = url + "?" + urllib.urlencode(sorted((parameters or {}).items())) + "#" + self._namespace
+        key_headers = sorted((name.lower(), val) for name, val in (headers or {}).items() if name.lower() in self._KEY_HEADERS)
+        if key_headers:
+            key += "#" + urllib.urlencode(key_headers)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json"
+
+    def _Load(self, name):
+        try:
+            with open(os.path.join(self._directory, name)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def _Store(self, name, entry):
+        path = os.path.join(self._directory, name)
+        tmp_path = "%s.%d.tmp" % (path, threading.current_thread().ident)
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.rename(tmp_path, path)
+        with self._lock:
+            if name in self._index:
+                self._size -= self._index[name][0]
+            size = os.path.getsize(path)
+            self._index[name] = [size, time.time()]
+            self._size += size
+            self._Evict()
+
+    def _Touch(self, name):
+        with self._lock:
+            if name in self._index:
+                self._index[name][1] = time.time()
+        try:
+            os.utime(os.path.join(self._directory, name), None)  # keeps the LRU order across runs
+        except OSError:
+            pass
+
+    def _Evict(self):
+        """Removes the least recently used entries until the cache fits in max_size (lock held)."""
+        if self._size <= self._max_size:
+            return
+        for name, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._size <= self._max_size:
+                break
+            try:
+                os.remove(os.path.join(self._directory, name))
+            except OSError:
+                pass
+            del self._index[name]
+            self._size -= size
+            self._stats["evictions"] += 1
+
+    def _Count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _RequestJson(self, request_json, url, parameters, headers, cnx):
+        name = self._GetFileName(url, parameters, headers)
+        entry = self._Load(name)
+        now = time.time()
+        org = self._GetOrg(url)
+        if (entry and now - entry["fetched_at"] < self._ttls.get(self._GetSourceType(url), self._ttls["default"]) and
+                entry["fetched_at"] >= self._expired.get((org, self._GetSourceType(url)), 0)):
+            self._Count("hits")
+            self._Touch(name)
+            return 200, entry["headers"], entry["output"]
+
+        headers = dict(headers or {})
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        status, response_headers, output = request_json("GET", url, parameters, headers, None, cnx)
+        if status == 304 and entry:
+            self._Count("revalidated")
+            entry["fetched_at"] = now
+            self._Store(name, entry)
+            return 200, entry["headers"], entry["output"]
+
+        self._Count("misses")
+        if status == 200:
+            if entry and entry["output"] != output and org:
+                for listener in self._listeners:
+                    listener(org, self._GetSourceType(url))
+            self._Store(name, {"url": url,
+                               "etag": response_headers.get("etag"),
+                               "last_modified": response_headers.get("last-modified"),
+                               "headers": response_headers,
+                               "output": output,
+                               "fetched_at": now})
+        return status, response_headers, output
+
+    def Install(self, github):
+        """Routes the GET requests of a Github instance through the cache."""
+        requester = github._Github__requester  # PyGithub has no public hook for its requests
+        request_json = requester.requestJson
+        def RequestJson(verb, url, parameters=None, headers=None, input=None, cnx=None):
+            if verb != "GET":
+                return request_json(verb, url, parameters, headers, input, cnx)
+            return self._RequestJson(request_json, url, parameters, headers, cnx)
+        requester.requestJson = RequestJson
+
+    def Expire(self, org, source_type):
+        """Has the cached responses of source_type (eg. "issues") of org revalidated on their next use."""
+        with self._lock:
+            self._expired[(org.lower(), source_type)] = time.time()
+
+    def AddListener(self, listener):
+        """Has listener(org, source type) called whenever a revalidated response has changed."""
+        self._listeners.append(listener)
+
+    def GetStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._index)
+            stats["size"] = self._size
+            return stats
+
+    def Clear(self):
+        with self._lock:
+            for name in self._index:
+                try:
+                    os.remove(os.path.join(self._directory, name))
+                except OSError:
+                    pass
+            self._index = {}
+            self._size = 0
@@ -0,0 +1,216 @@
+"""Hash joins of two sources.
+
+Fields of a join are qualified with the alias of their source (eg. "pulls.title").
+The side estimated to be smaller is the build side: it's fetched first and hashed
+on its join keys, then the other (probe) side is matched against it. WHERE
+conjuncts reading a single side are evaluated on it before the join. A probe side
+listed repo by repo and joined on its repo only lists the repos of the build side.
+
+Sample Usage:
+    join = SgJoin(g, [(u"servo.pulls", u"pulls", None), (u"servo.repos", u"repos", None)], u"pulls.repo = repos.name")
+    join.SetRelKeys([u"pulls.title", u"repos.stargazers_count"])
+    print(join.Fetch(u"repos.stargazers_count > 100"))
+"""
+
+import itertools
+from multiprocessing.pool import ThreadPool
+
+import table as tb
+import table_fetcher
+import utilities as util
+from expression import SgExpression
+
+
+class _Side:
+    """A source of a join."""
+
+    def __init__(self, label, alias, max_staleness):
+        self.label = label
+        self.alias = alias
+        self.max_staleness = max_staleness
+        self.keys = []  # qualified fields joined on, in the order of the key pairs
+        self.conjuncts = []  # programs of the WHERE conjuncts reading only this side
+        self.fetcher = None
+
+    def Qualify(self, table):
+        ret = tb.SgTable()
+        ret.SetFields([self.alias + u"." + field for field in table.GetFields()])
+        if len(table):
+            ret.SetCols(table.GetCols(), len(table))
+        return ret
+
+
+class SgJoin:
+    """Hash joins of two sources."""
+
+    # sources listed repo by repo, which can be limited to some repos
+    _REPO_LISTED_SOURCES = (u"issues", u"pulls", u"commits")
+
+    def __init__(self, github, sources, on, fetch_options=None):
+        """sources are the (label, alias, max_staleness) of both sides, on is the join condition."""
+        self._github = github
+        self._fetch_options = fetch_options
+        self._sides = [_Side(*source) for source in sources]
+        if len(set(side.alias.lower() for side in self._sides)) != len(self._sides):
+            raise SyntaxError("Joined sources need different aliases.")
+        self._on = on
+        self._residual = []  # programs of the conjuncts evaluated after the join
+        for program in SgExpression.SplitConjuncts(SgExpression.Compile(on)):
+            fields = SgExpression.ExtractFieldEquality(program)
+            sides = [self._GetSide(field) for field in fields] if fields else None
+            if sides and sides[0] is not sides[1]:
+                for side, field in zip(sides, fields):
+                    side.keys.append(field)
+            else:
+                self._residual.append(program)
+        if not self._sides[0].keys:
+            raise SyntaxError("JOIN ... ON needs an equality between fields of both sources.")
+
+    def _GetSide(self, field):
+        alias = field.split(u".")[0].lower() if u"." in field else None
+        for side in self._sides:
+            if side.alias.lower() == alias:
+                return side
+        raise SyntaxError("Field %s isn't qualified with the alias of a joined source." % field)
+
+    def _GetSides(self):
+        """Returns (build side, probe side)."""
+        left, right = self._sides
+        if left.fetcher.EstimateRows(left.label) <= right.fetcher.EstimateRows(right.label):
+            return left, right
+        return right, left
+
+    def _GetRepoKey(self, probe):
+        """Returns the index of the key the probe side can be limited to the repos of, None if there's none."""
+        parts = probe.label.split(u".")
+        if len(parts) < 2 or parts[1] not in self._REPO_LISTED_SOURCES:
+            return None
+        fields = [key.split(u".", 1)[1] for key in probe.keys]
+        return fields.index(u"repo") if u"repo" in fields else None
+
+    def _SplitCondition(self, condition):
+        """Assigns the WHERE conjuncts reading a single side to it, returns the others."""
+        for side in self._sides:
+            side.conjuncts = []
+        if not condition:
+            return []
+        others = []
+        for program in SgExpression.SplitConjuncts(SgExpression.Compile(condition)):
+            sides = set(self._GetSide(field) for field in SgExpression.GetFields(program))
+            if len(sides) == 1:
+                sides.pop().conjuncts.append(program)
+            else:
+                others.append(program)
+        return others
+
+    def _Fetch(self, side, repos=None):
+        table = side.Qualify(side.fetcher.Fetch(side.label, max_staleness=side.max_staleness, repos=repos))
+        for program in side.conjuncts:
+            if not len(table):
+                break
+            table = table.FilterRows(SgExpression.EvaluateConditionProgram(table, program))
+        return table
+
+    def _HashJoin(self, build, build_table, probe, probe_table):
+        """Returns the rows of both tables with equal keys, the fields of the left side first."""
+        index = {}  # key -> indices of the build rows
+        for idx, key in enumerate(itertools.izip(*[build_table.GetVals(key) for key in build.keys])):
+            if None not in key:
+                index.setdefault(util.HashKey(key), []).append(idx)
+        build_idxs = []
+        probe_idxs = []
+        for idx, key in enumerate(itertools.izip(*[probe_table.GetVals(key) for key in probe.keys])):
+            matches = index.get(util.HashKey(key)) if None not in key else None
+            if matches:
+                build_idxs.extend(matches)
+                probe_idxs.extend([idx] * len(matches))
+        tables = [(build_table, build_idxs), (probe_table, probe_idxs)]
+        if build is not self._sides[0]:
+            tables.reverse()
+        ret = tb.SgTable()
+        ret.SetFields(tables[0][0].GetFields() + tables[1][0].GetFields())
+        if build_idxs:
+            ret.SetCols([[column[idx] for idx in idxs] for table, idxs in tables for column in table.GetCols()], len(build_idxs))
+        return ret
+
+    def SetRelKeys(self, rel_keys):
+        """Sets the (qualified) fields the query reads, u"*" for all of them."""
+        fields = dict((side, list(side.keys)) for side in self._sides)
+        for program in self._residual:
+            for field in SgExpression.GetFields(program):
+                fields[self._GetSide(field)].append(field)
+        for field in rel_keys:
+            if field != u"*":
+                fields[self._GetSide(field)].append(field)
+        for side in self._sides:
+            side_keys = [u"*"] if u"*" in rel_keys else list(set(field.split(u".", 1)[1] for field in fields[side]))
+            side.fetcher = table_fetcher.SgTableFetcher(self._github, side_keys, **(self._fetch_options or {}))
+
+    def Fetch(self, condition=None):
+        """Returns the joined rows meeting condition (the WHERE of the query)."""
+        others = self._SplitCondition(condition)
+        build, probe = self._GetSides()
+        repo_key = self._GetRepoKey(probe)
+        if repo_key is None:  # nothing to pass from one side to the other, both are fetched at once
+            pool = ThreadPool(2)
+            try:
+                build_table, probe_table = pool.map(self._Fetch, [build, probe])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            build_table = self._Fetch(build)
+            if not len(build_table):
+                return build_table
+            repos = set(val for val in build_table.GetVals(build.keys[repo_key]) if isinstance(val, basestring))
+            probe_table = self._Fetch(probe, repos)
+        if not len(build_table) or not len(probe_table):
+            return tb.SgTable()
+        table = self._HashJoin(build, build_table, probe, probe_table)
+        for program in self._residual + others:
+            if not len(table):
+                break
+            table = table.FilterRows(SgExpression.EvaluateConditionProgram(table, program))
+        return table
+
+    def Describe(self, condition=None):
+        """Returns how the join would be done, for EXPLAIN."""
+        self._SplitCondition(condition)
+        build, probe = self._GetSides()
+        details = [u"hash join on %s" % self._on,
+                   u"builds on %s (~%d rows estimated)" % (build.alias, build.fetcher.EstimateRows(build.label))]
+        if self._GetRepoKey(probe) is not None:
+            details.append(u"%s fetched first, %s only lists the repos joined" % (build.alias, probe.alias))
+        else:
+            details.append(u"both sides fetched at once")
+        for side in (build, probe):
+            details.append(u"%s: %s" % (side.alias, side.fetcher.Describe(side.label, max_staleness=side.max_staleness)))
+            if side.conjuncts:
+                details.append(u"%d WHERE conjunct(s) on %s before the join" % (len(side.conjuncts), side.alias))
+        return u", ".join(details)
+
+    def GetCompletionFields(self):
+        """Returns the (qualified) fields to fetch which cost one extra request per row."""
+        return [side.alias + u"." + field for side in self._sides for field in side.fetcher.GetCompletionFields(side.label)]
+
+    def GetSources(self):
+        """Returns the (org, source type) pairs the join is computed from."""
+        sources = []
+        for side in self._sides:
+            sources += [source for source in side.fetcher.GetSources(side.label) if source not in sources]
+        return sources
+
+    def GetMaxStaleness(self):
+        stalenesses = [side.max_staleness for side in self._sides if side.max_staleness is not None]
+        return min(stalenesses) if stalenesses else None
+
+    def SetMetrics(self, metrics):
+        for side in self._sides:
+            side.fetcher.SetMetrics(metrics)
+
+    def GetStats(self):
+        stats = {}
+        for side in self._sides:
+            for key, val in side.fetcher.GetStats().items():
+                stats[key] = stats.get(key, 0) + val
+        return stats
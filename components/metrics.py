@@ -0,0 +1,93 @@
+"""Metrics of query executions: stage timings, HTTP requests, listings and expression timings.
+
+Sample Usage:
+    g = Github(token)
+    metrics = SgMetrics()
+    metrics.Install(g)
+    session = SgParser(g).Parse(tokens)
+    session.Execute(metrics)
+    print(json.dumps(metrics.GetReport(), indent=2))
+"""
+
+import resource
+import sys
+import threading
+import time
+
+from explain import SgExplainer
+
+
+class SgMetrics(SgExplainer):
+    """Metrics of query executions: stage timings, HTTP requests, listings and expression timings."""
+
+    LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # upper bounds in seconds
+
+    _TOP_EXPRESSIONS = 10
+
+    def __init__(self):
+        SgExplainer.__init__(self, self._GetCounters)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._latencies = [0] * (len(self.LATENCY_BUCKETS) + 1)  # the last one is for the slower ones
+        self._latency_total = 0.0
+        self._listings = {"count": 0, "rows": 0, "time": 0.0}
+        self._expressions = {}  # expression -> [calls, time]
+
+    def _GetCounters(self):
+        with self._lock:
+            return {u"requests": self._requests}
+
+    def _RequestJson(self, request_json, verb, url, parameters, headers, input, cnx):
+        start_time = time.time()
+        status, response_headers, output = request_json(verb, url, parameters, headers, input, cnx)
+        latency = time.time() - start_time
+        bucket = next((idx for idx, bound in enumerate(self.LATENCY_BUCKETS) if latency <= bound), len(self.LATENCY_BUCKETS))
+        with self._lock:
+            self._requests += 1
+            self._errors += status >= 400
+            self._latencies[bucket] += 1
+            self._latency_total += latency
+        return status, response_headers, output
+
+    def Install(self, github):
+        """Times the requests of a Github instance (install it before a cache to only time the network)."""
+        requester = github._Github__requester  # PyGithub has no public hook for its requests
+        request_json = requester.requestJson
+        def RequestJson(verb, url, parameters=None, headers=None, input=None, cnx=None):
+            return self._RequestJson(request_json, verb, url, parameters, headers, input, cnx)
+        requester.requestJson = RequestJson
+
+    def AddListing(self, rows, seconds):
+        """Records a listing (eg. the issues of a repo) fetched by SgTableFetcher."""
+        with self._lock:
+            self._listings["count"] += 1
+            self._listings["rows"] += rows
+            self._listings["time"] += seconds
+
+    def AddExpressionTime(self, expr, seconds):
+        """Records an evaluation of expr over a table, the timer of SgExpression."""
+        with self._lock:
+            entry = self._expressions.setdefault(expr, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def GetPeakMemory(self):
+        """Returns the peak resident memory of the process in KB."""
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KB on Linux
+
+    def GetReport(self):
+        """Returns the metrics as a JSON-serializable dict."""
+        with self._lock:
+            bounds = [u"<=%ss" % bound for bound in self.LATENCY_BUCKETS] + [u">%ss" % self.LATENCY_BUCKETS[-1]]
+            expressions = sorted(self._expressions.items(), key=lambda item: item[1][1], reverse=True)[:self._TOP_EXPRESSIONS]
+            return {"stages": [{"stage": stage[0], "time": stage[1], "rows_in": stage[2], "rows_out": stage[3], "requests": stage[4]}
+                               for stage in self._stages],
+                    "peak_memory_kb": self.GetPeakMemory(),
+                    "http": {"requests": self._requests,
+                             "errors": self._errors,
+                             "latency_total": self._latency_total,
+                             "latency_histogram": [{"bucket": bound, "requests": count} for bound, count in zip(bounds, self._latencies)]},
+                    "listings": dict(self._listings),
+                    "top_expressions": [{"expression": expr, "calls": calls, "time": seconds} for expr, (calls, seconds) in expressions]}
@@ -1,46 +1,48 @@
 """Functions for sorting tables."""
 
-import random
+import heapq
+import itertools
 
 from expression import SgExpression
 
 
+def _OrderIndices(keys, reverses, limit=None):
+    """Returns the indices of keys in (stable) sorted order, only the first limit ones if given.
+
+    keys[i] is the tuple of order-by values of row i, reverses[j] is 1 (ASC) or -1 (DESC) for column j.
+    NULLs come first in ascending and last in descending order.
+    """
+    if not keys:
+        return []
+    cols = [[(val is not None, val) for val in col] for col in itertools.izip(*keys)]  # decorate
+    indices = range(len(keys))
+    descending = reverses[0] == -1
+    if all(reverse == reverses[0] for reverse in reverses):
+        keys = zip(*cols) if len(cols) > 1 else cols[0]
+        if limit is not None and limit < len(indices):  # top-N with a bounded heap
+            return (heapq.nlargest if descending else heapq.nsmallest)(limit, indices, key=keys.__getitem__)
+        indices.sort(key=keys.__getitem__, reverse=descending)
+    else:
+        if limit is not None and limit < len(indices):  # only rows tied with the top N on the first column can make it
+            first = cols[0]
+            cutoff = (heapq.nlargest if descending else heapq.nsmallest)(limit, first)[-1]
+            indices = [idx for idx in indices if (first[idx] >= cutoff if descending else first[idx] <= cutoff)]
+        for col, reverse in reversed(zip(cols, reverses)):  # one stable pass per column, least significant first
+            indices.sort(key=col.__getitem__, reverse=reverse == -1)
+    return indices[:limit] if limit is not None else indices
+
+
 class SgOrdering:
 
     def __init__(self, table, reverses):
         self._table = table
         self._reverses = reverses
 
-    def _Swap(self, row1, row2):
-        self._table[row1], self._table[row2] = self._table[row2], self._table[row1]
-
-    def _Cmp(self, row1, row2):
+    def Sort(self, keep_order_fields=False, limit=None):
         cmps = len(self._reverses)
-        cmp1 = self._table[row1][-cmps:]
-        cmp2 = self._table[row2][-cmps:]
-        for i in range(cmps):
-            if cmp1[i] < cmp2[i]:
-                return -1 * self._reverses[i]
-            elif cmp1[i] > cmp2[i]:
-                return 1 * self._reverses[i]
-        return 0
-
-    def _Sort(self, low, high):
-        if (low >= high):
-            return
-        pivot = low + random.randrange(high - low + 1)
-        self._Swap(pivot, high)
-        it = low
-        for i in range(low, high):
-            if self._Cmp(i, high) <= 0:
-                self._Swap(it, i)
-                it = it + 1
-        self._Swap(it, high)
-        self._Sort(low, it-1)
-        self._Sort(it+1, high)
-
-    def Sort(self, keep_order_fields=False):
-        self._Sort(0, len(self._table)-1)
+        rows = self._table.GetTable()
+        order = _OrderIndices([row[-cmps:] for row in rows], self._reverses, limit)
+        self._table.SetTable([rows[i] for i in order])
         return self._table.SliceCol(0, len(self._table.GetFields()) - len(self._reverses)) if not keep_order_fields else self._table
 
 
@@ -50,34 +52,8 @@ class SgTableOrdering:
         self._tables = tables
         self._reverses = reverses
 
-    def _Swap(self, idx1, idx2):
-        self._tables[idx1], self._tables[idx2] = self._tables[idx2], self._tables[idx1]
-
-    def _Cmp(self, idx1, idx2):
+    def Sort(self, limit=None):
         cmps = len(self._reverses)
-        cmp1 = self._tables[idx1][0][-cmps:]
-        cmp2 = self._tables[idx2][0][-cmps:]
-        for i in range(cmps):
-            if cmp1[i] < cmp2[i]:
-                return -1 * self._reverses[i]
-            elif cmp1[i] > cmp2[i]:
-                return 1 * self._reverses[i]
-        return 0
-
-    def _Sort(self, low, high):
-        if (low >= high):
-            return
-        pivot = low + random.randrange(high - low + 1)
-        self._Swap(pivot, high)
-        it = low
-        for i in range(low, high):
-            if self._Cmp(i, high) <= 0:
-                self._Swap(it, i)
-                it = it + 1
-        self._Swap(it, high)
-        self._Sort(low, it-1)
-        self._Sort(it+1, high)
-
-    def Sort(self):
-        self._Sort(0, len(self._tables)-1)
+        order = _OrderIndices([table[0][-cmps:] for table in self._tables], self._reverses, limit)
+        self._tables = [self._tables[i] for i in order]
         return [table.SliceCol(0, len(table.GetFields()) - len(self._reverses)) for table in self._tables]
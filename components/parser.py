@@ -1,28 +1,33 @@
-"""Parser for SQLGitHub. Outputs SgSession.
+"""Parser for SQLGitHub. Outputs SgSession (or SgUnion of them).
 
 Sample Usage:
     g = Github(token)
     parser = SgParser(g)
     s = parser.Parse(["select", "name,", "description", "from", "abseil.repos"])
+    u = parser.Parse(["select", "title", "from", "servo.issues.closed.7", "union", "all", "select", "title", "from", "servo.pulls.closed.7"])
     print(s.Execute())
     print(parser._ParseOrder(["by", "a+b", "DESC,", "c", "-", "b", "ASC", ",", "a%b"]))
 """
 
 import definition
+import join
 import session
+import union
+import utilities as util
 
 
-# TODO(lnishan): Change it to SgParseSimple, modify tokenizer and add SgParser to handle unions and joins.
 class SgParser:
-    """Parser for SQLGitHub. Outputs SgSession."""
+    """Parser for SQLGitHub. Outputs SgSession (or SgUnion of them)."""
     
-    def __init__(self, github):
+    def __init__(self, github, fetch_options=None):
         self._github = github
+        self._fetch_options = fetch_options
         self._Initialize()
 
     def _Initialize(self):
         self._field_exprs = None
         self._source = None
+        self._max_staleness = None
         self._condition = None
         self._groups = None
         self._having = None
@@ -71,9 +76,47 @@ class SgParser:
         sub_tokens_str = u" ".join(sub_tokens)
         self._field_exprs = self.__GetCommaSeparatedExprs(sub_tokens_str)
 
+    def _ParseSource(self, sub_tokens):
+        """Parses "label [[as] alias] [with max_staleness duration]", returns (label, alias, max_staleness)."""
+        if not sub_tokens:
+            raise SyntaxError("SQL syntax incorrect.")
+        label, alias, max_staleness = sub_tokens[0], None, None
+        rest = sub_tokens[1:]
+        if rest and rest[0].lower() == u"as":
+            rest = rest[1:]
+            if not rest:
+                raise SyntaxError("SQL syntax incorrect.")
+        if rest and rest[0].lower() != u"with":
+            alias = rest[0]
+            rest = rest[1:]
+        if rest:  # eg. "servo.issues with max_staleness 10m"
+            if len(rest) != 3 or [token.lower() for token in rest[:2]] != [u"with", u"max_staleness"]:
+                raise SyntaxError("SQL syntax incorrect.")
+            max_staleness = util.ParseDuration(rest[2])
+        if alias is None:
+            parts = label.split(u".")
+            alias = parts[1] if len(parts) > 1 else parts[0]  # eg. "issues" for "servo.issues.closed"
+        return label, alias, max_staleness
+
     def _ParseFrom(self, sub_tokens):
         # TODO(lnishan): Handle sub-queries (by creating another SgParser instance) here
-        self._source = sub_tokens[0]
+        sub_tokens = [token for token in sub_tokens if token]
+        lowered = [token.lower() for token in sub_tokens]
+        if u"join" in lowered:  # eg. "servo.pulls join servo.repos on pulls.repo = repos.name"
+            join_idx = lowered.index(u"join")
+            if lowered.count(u"join") > 1:
+                raise NotImplementedError("Only one JOIN is supported.")
+            if u"on" not in lowered[join_idx:]:
+                raise SyntaxError("SQL syntax incorrect.")
+            on_idx = lowered.index(u"on", join_idx)
+            left_end = join_idx - 1 if join_idx and lowered[join_idx - 1] == u"inner" else join_idx
+            sources = [self._ParseSource(sub_tokens[:left_end]), self._ParseSource(sub_tokens[join_idx + 1:on_idx])]
+            self._source = join.SgJoin(self._github, sources, u" ".join(sub_tokens[on_idx + 1:]), self._fetch_options)
+            return
+        label, _, self._max_staleness = self._ParseSource(sub_tokens)
+        if len(sub_tokens) > 1 and sub_tokens[1].lower() != u"with":
+            raise SyntaxError("SQL syntax incorrect.")  # aliases are for joins
+        self._source = label
 
     def _ParseWhere(self, sub_tokens):
         self._condition = u" ".join(sub_tokens)
@@ -121,7 +164,47 @@ class SgParser:
         else:
             raise NotImplementedError("Command token not implemented.")
     
-    def Parse(self, tokens):
+    def _IsInString(self, token, in_string):
+        """Returns whether a string literal is open after token, in_string being whether one was before it."""
+        is_escaping = False
+        for ch in token:
+            if in_string:
+                if is_escaping:
+                    is_escaping = False
+                elif ch == "\\":
+                    is_escaping = True
+                elif ch in (u"\'", u"\""):
+                    in_string = False
+            elif ch in (u"\'", u"\""):
+                in_string = True
+        return in_string
+
+    def _SplitUnion(self, tokens):
+        """Splits tokens at UNION [ALL | DISTINCT] (outside string literals), returns (tokens of each branch, whether each UNION drops duplicates)."""
+        branches = [[]]
+        distincts = []
+        after_union = False
+        in_string = False
+        for token in tokens:
+            lowered = token.lower()
+            if in_string:
+                branches[-1].append(token)
+                in_string = self._IsInString(token, in_string)
+            elif lowered == u"union":
+                branches.append([])
+                distincts.append(True)
+                after_union = True
+            elif after_union and lowered in (u"all", u"distinct"):
+                distincts[-1] = lowered == u"distinct"
+                after_union = False
+            else:
+                if token:
+                    after_union = False
+                branches[-1].append(token)
+                in_string = self._IsInString(token, in_string)
+        return branches, distincts
+
+    def _ParseClauses(self, tokens):
         self._Initialize()
         cmd_token = None
         sub_tokens = []
@@ -137,4 +220,25 @@ class SgParser:
             self._ParseCmdToken(cmd_token, sub_tokens)
         if not self._field_exprs:
             raise SyntaxError("SQL syntax incorrect.")
-        return session.SgSession(self._github, self._field_exprs, self._source, self._condition, self._groups, self._having, self._orders, self._limit)
+
+    def _CreateSession(self):
+        return session.SgSession(self._github, self._field_exprs, self._source, self._condition, self._groups, self._having, self._orders, self._limit, self._fetch_options, self._max_staleness)
+
+    def Parse(self, tokens):
+        branches, distincts = self._SplitUnion(tokens)
+        if len(branches) == 1:
+            self._ParseClauses(tokens)
+            return self._CreateSession()
+        sessions = []
+        num_fields = set()
+        for branch in branches:
+            self._ParseClauses(branch)
+            if u"*" not in self._field_exprs:
+                num_fields.add(len(self._field_exprs))
+            if branch is branches[-1]:  # ORDER BY and LIMIT after the last branch are the union's
+                orders, limit = self._orders, self._limit
+                self._orders, self._limit = None, None
+            sessions.append(self._CreateSession())
+        if len(num_fields) > 1:
+            raise SyntaxError("Branches of a UNION need the same number of fields.")
+        return union.SgUnion(sessions, distincts, orders, limit)
@@ -0,0 +1,106 @@
+"""A local replica of org sources (issues, pulls and commits) in SQLite.
+
+Raw list payloads are stored per (org, source, repo) along with a high-water mark
+(the latest updated_at, or commit date, seen), so that a later sync only needs
+what changed since then.
+
+Sample Usage:
+    replica = SgReplica("replica.sqlite")
+    replica.Update(u"abseil", u"issues", u"abseil-cpp", 0, items, u"2018-01-02T03:04:05Z", time.time())
+    print(replica.GetSyncedAt(u"abseil", u"issues"))
+    print(list(replica.Load(u"abseil", u"issues", state=u"open")))
+"""
+
+import json
+import sqlite3
+import threading
+
+
+class SgReplica:
+    """A local replica of org sources (issues, pulls and commits) in SQLite."""
+
+    _SCHEMA = ["CREATE TABLE IF NOT EXISTS repos (org TEXT, source TEXT, repo TEXT, position INTEGER, high_water TEXT, synced_at REAL, "
+               "PRIMARY KEY (org, source, repo))",
+               "CREATE TABLE IF NOT EXISTS items (org TEXT, source TEXT, repo TEXT, key TEXT, sort_key, state TEXT, updated TEXT, payload TEXT, "
+               "PRIMARY KEY (org, source, repo, key))"]
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = None  # the database is only created once it's used
+        self._listeners = []  # called with (org, source) when a sync brings changes
+
+    def _GetConnection(self):
+        """Returns the connection to the database (lock held)."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            for statement in self._SCHEMA:
+                self._conn.execute(statement)
+            self._conn.commit()
+        return self._conn
+
+    def GetSyncedAt(self, org, source):
+        """Returns when the least recently synced repo of org was synced, None if source was never synced."""
+        with self._lock:
+            return self._GetConnection().execute("SELECT MIN(synced_at) FROM repos WHERE org = ? AND source = ?",
+                                                 (org.lower(), source)).fetchone()[0]
+
+    def GetHighWaterMarks(self, org, source):
+        """Returns {repo: high-water mark} of the repos of org."""
+        with self._lock:
+            return dict(self._GetConnection().execute("SELECT repo, high_water FROM repos WHERE org = ? AND source = ?",
+                                                      (org.lower(), source)))
+
+    def Update(self, org, source, repo, position, items, high_water, synced_at):
+        """Stores the (key, sort_key, state, updated, raw payload) items of a repo synced at synced_at."""
+        with self._lock:
+            conn = self._GetConnection()
+            with conn:  # one transaction
+                conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(org.lower(), source, repo, unicode(key), sort_key, state, updated, json.dumps(raw))
+                                  for key, sort_key, state, updated, raw in items])
+                conn.execute("INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?, ?, ?)",
+                             (org.lower(), source, repo, position, high_water, synced_at))
+        if items:
+            for listener in self._listeners:
+                listener(org, source)
+
+    def RemoveOtherRepos(self, org, source, repos):
+        """Removes the repos of org which aren't in repos (eg. deleted or transferred)."""
+        with self._lock:
+            conn = self._GetConnection()
+            with conn:
+                stored = [row[0] for row in conn.execute("SELECT repo FROM repos WHERE org = ? AND source = ?", (org.lower(), source))]
+                removed = set(stored) - set(repos)
+                for repo in removed:
+                    conn.execute("DELETE FROM items WHERE org = ? AND source = ? AND repo = ?", (org.lower(), source, repo))
+                    conn.execute("DELETE FROM repos WHERE org = ? AND source = ? AND repo = ?", (org.lower(), source, repo))
+        if removed:
+            for listener in self._listeners:
+                listener(org, source)
+
+    def AddListener(self, listener):
+        """Has listener(org, source) called whenever a sync changes the replica of source."""
+        self._listeners.append(listener)
+
+    def Load(self, org, source, state=None, since=None, until=None):
+        """Returns the raw payloads of source in org, repo by repo, latest first.
+
+        Only the items in state (if given) and updated between since and until (if given) are returned.
+        """
+        query = ("SELECT items.payload FROM items JOIN repos ON items.org = repos.org AND items.source = repos.source AND items.repo = repos.repo "
+                 "WHERE items.org = ? AND items.source = ?")
+        args = [org.lower(), source]
+        if state:
+            query += " AND items.state = ?"
+            args.append(state)
+        if since:
+            query += " AND items.updated >= ?"
+            args.append(since)
+        if until:
+            query += " AND items.updated <= ?"
+            args.append(until)
+        query += " ORDER BY repos.position, items.sort_key DESC"
+        with self._lock:
+            payloads = [row[0] for row in self._GetConnection().execute(query, args)]
+        return [json.loads(payload) for payload in payloads]
@@ -0,0 +1,157 @@
+"""A rate-limit-aware scheduler for GitHub API requests.
+
+Requests are spread round-robin over a pool of tokens. The X-RateLimit-Remaining
+and X-RateLimit-Reset headers of every response keep track of each token's quota,
+less the requests in flight (a slot is reserved for each one until its response):
+a token running low is paced to last until its reset, an exhausted one is skipped
+(or waited for, if every token is). Secondary rate limits are retried after their
+Retry-After, or with exponential backoff and jitter.
+
+Sample Usage:
+    g = Github(token)
+    scheduler = SgRequestScheduler()
+    scheduler.Install(g, [Github(other_token)])
+    print(g.get_organization("abseil").name)
+    print(scheduler.GetStats())
+"""
+
+import random
+import sys
+import threading
+import time
+
+
+class _TokenState:
+    """The quota of a token as of its last response."""
+
+    def __init__(self):
+        self.remaining = None  # unknown until the first response
+        self.in_flight = 0  # requests sent and not answered yet, counted against remaining
+        self.reset = 0  # epoch time the quota is reset at
+        self.next_time = 0  # earliest time of its next request (pacing)
+        self.requests = 0
+
+
+class SgRequestScheduler:
+    """A rate-limit-aware scheduler for GitHub API requests."""
+
+    _LONG_WAIT = 5  # seconds, waits longer than this are reported on stderr
+    _IN_FLIGHT_WAIT = 0.1  # seconds, tokens exhausted by requests in flight are checked again after this
+
+    def __init__(self, max_retries=5, backoff=1.0, max_backoff=60.0, pace_below=100, clock=time.time, sleep=time.sleep):
+        self._max_retries = max_retries
+        self._backoff = backoff  # seconds, doubled on every retry of a secondary rate limit
+        self._max_backoff = max_backoff
+        self._pace_below = pace_below  # tokens with less requests remaining are paced to last until their reset
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._request_jsons = []  # the original requestJson of every token's requester
+        self._tokens = []  # _TokenState of every token
+        self._next = 0  # round-robin position
+        self._stats = {"requests": 0, "retries": 0, "waited": 0.0, "bytes": 0, "rate_limit_used": 0}
+
+    def _Acquire(self):
+        """Picks the token of the next request, waits for it if needed, returns its index."""
+        while True:
+            with self._lock:
+                now = self._clock()
+                for offset in range(len(self._tokens)):
+                    idx = (self._next + offset) % len(self._tokens)
+                    state = self._tokens[idx]
+                    remaining = state.remaining - state.in_flight if state.remaining is not None else None
+                    if remaining is not None and remaining <= 0 and now < state.reset:
+                        continue  # exhausted
+                    self._next = idx + 1
+                    delay = max(0, state.next_time - now)
+                    if remaining is not None and remaining < self._pace_below and state.reset > now:
+                        state.next_time = max(now, state.next_time) + (state.reset - now) / float(remaining + 1)
+                    state.in_flight += 1  # reserved until _Update
+                    state.requests += 1
+                    self._stats["requests"] += 1
+                    break
+                else:
+                    idx = None
+                    delay = min(state.reset for state in self._tokens) - now + 1
+                    if any(state.in_flight for state in self._tokens):  # their responses may bring a new reset
+                        delay = min(delay, self._IN_FLIGHT_WAIT)
+            if delay > self._LONG_WAIT:
+                sys.stderr.write("Rate limit %s, waiting %ds.\n" % ("exhausted on every token" if idx is None else "running low", delay))
+            self._Wait(delay)
+            if idx is not None:
+                return idx
+
+    def _Wait(self, delay):
+        if delay > 0:
+            with self._lock:
+                self._stats["waited"] += delay
+            self._sleep(delay)
+
+    def _Update(self, idx, headers):
+        """Releases the slot of a request of token idx, updating its quota from the response headers."""
+        with self._lock:
+            state = self._tokens[idx]
+            state.in_flight -= 1
+            reset = int(headers["x-ratelimit-reset"]) if "x-ratelimit-reset" in headers else state.reset
+            if reset < state.reset:
+                return  # answered in an earlier quota window
+            if "x-ratelimit-remaining" in headers:
+                remaining = int(headers["x-ratelimit-remaining"])
+                # responses can arrive out of order, the lowest count of a window is the latest
+                if state.remaining is None or reset > state.reset or remaining < state.remaining:
+                    state.remaining = remaining
+            state.reset = reset
+
+    def _GetRetryDelay(self, idx, status, headers, output, attempt):
+        """Returns how long to wait before retrying a response, None if it's final."""
+        if status not in (403, 429) or attempt >= self._max_retries:
+            return None
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+        if headers.get("x-ratelimit-remaining") == "0":
+            return 0  # primary rate limit, _Acquire moves on to another token or waits for the reset
+        if "rate limit" in (output or "") or "abuse" in (output or ""):  # secondary rate limit without Retry-After
+            return min(self._max_backoff, self._backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return None
+
+    def _RequestJson(self, verb, url, parameters, headers, input, cnx):
+        attempt = 0
+        while True:
+            idx = self._Acquire()
+            try:
+                status, response_headers, output = self._request_jsons[idx](verb, url, dict(parameters or {}), dict(headers or {}), input, cnx)
+            except Exception:
+                self._Update(idx, {})
+                raise
+            self._Update(idx, response_headers)
+            with self._lock:
+                self._stats["bytes"] += len(output or "")
+                if status != 304:  # conditional requests answered with 304 don't count against the rate limit
+                    self._stats["rate_limit_used"] += 1
+            delay = self._GetRetryDelay(idx, status, response_headers, output, attempt)
+            if delay is None:
+                return status, response_headers, output
+            attempt += 1
+            with self._lock:
+                self._stats["retries"] += 1
+            self._Wait(delay)
+
+    def Install(self, github, pool=None):
+        """Routes the requests of a Github instance through the scheduler.
+
+        pool is a list of more Github instances (with other tokens) to spread the requests over.
+        """
+        requester = github._Github__requester  # PyGithub has no public hook for its requests
+        for g in [github] + (pool or []):
+            self._request_jsons.append(g._Github__requester.requestJson)
+            self._tokens.append(_TokenState())
+        def RequestJson(verb, url, parameters=None, headers=None, input=None, cnx=None):
+            return self._RequestJson(verb, url, parameters, headers, input, cnx)
+        requester.requestJson = RequestJson
+
+    def GetStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tokens"] = [{"requests": state.requests, "remaining": state.remaining, "reset": state.reset}
+                               for state in self._tokens]
+            return stats
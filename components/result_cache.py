@@ -0,0 +1,115 @@
+"""A persistent cache for query results.
+
+Results are keyed by the normalized (tokenized) SQL and kept for a TTL, or
+until a source they were computed from changes: the HTTP cache and the replica
+report each (org, source) whose data they saw change, and results computed
+before that are dropped.
+
+Sample Usage:
+    cache = SgResultCache("http_cache/results")
+    cache.Put(tokens, [(u"abseil", u"repos")], result)
+    print(cache.Get(tokens))
+    cache.Invalidate(u"abseil", u"repos")
+    print(cache.Get(tokens))
+"""
+
+import cPickle
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class SgResultCache:
+    """A persistent cache for query results."""
+
+    DEFAULT_TTL = 60  # in seconds
+    MAX_ENTRIES = 256  # the least recently used results are removed past this
+
+    _CHANGES_FILE = "changes.json"  # "org/source" -> when its data last changed
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, namespace=u""):
+        self._directory = directory
+        self._ttl = ttl
+        self._namespace = namespace  # eg. a hash of the token, results depend on who asks
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _GetFileName(self, tokens):
+        key = u" ".join(tokens) + u"#" + self._namespace  # as the parser joins them, spaces in string literals matter
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pickle"
+
+    def _LoadChanges(self):
+        try:
+            with open(os.path.join(self._directory, self._CHANGES_FILE)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _Write(self, name, data):
+        path = os.path.join(self._directory, name)
+        tmp_path = "%s.%d.tmp" % (path, threading.current_thread().ident)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def _Evict(self):
+        names = [name for name in os.listdir(self._directory) if name.endswith(".pickle")]
+        if len(names) <= self.MAX_ENTRIES:
+            return
+        paths = sorted((os.path.join(self._directory, name) for name in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.MAX_ENTRIES]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def Get(self, tokens):
+        """Returns the cached result of a tokenized query, None if there's none or it's stale."""
+        path = os.path.join(self._directory, self._GetFileName(tokens))
+        try:
+            with open(path, "rb") as f:
+                entry = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            entry = None
+        with self._lock:
+            changes = self._LoadChanges()
+            if (entry and time.time() - entry["completed_at"] < entry["ttl"] and
+                    all(changes.get(u"%s/%s" % tuple(source), 0) <= entry["completed_at"] for source in entry["sources"])):
+                self._stats["hits"] += 1
+                os.utime(path, None)  # keeps the LRU order
+                return entry["result"]
+            self._stats["misses"] += 1
+            return None
+
+    def Put(self, tokens, sources, result, max_age=None):
+        """Stores the result of a tokenized query computed from sources, a list of (org, source).
+
+        The result is kept for the TTL, or max_age seconds if that's shorter. Results
+        holding objects that can't be pickled (eg. the PyGithub object of a commit's tree)
+        aren't cached.
+        """
+        entry = {"result": result,
+                 "sources": [(org.lower(), source) for org, source in sources],
+                 "ttl": min(self._ttl, max_age) if max_age is not None else self._ttl,
+                 "completed_at": time.time()}
+        try:
+            data = cPickle.dumps(entry, cPickle.HIGHEST_PROTOCOL)
+        except (cPickle.PicklingError, TypeError, AttributeError):
+            return
+        self._Write(self._GetFileName(tokens), data)
+        self._Evict()
+
+    def Invalidate(self, org, source):
+        """Drops the results computed from source (eg. u"issues") of org before now."""
+        with self._lock:
+            changes = self._LoadChanges()
+            changes[u"%s/%s" % (org.lower(), source)] = time.time()
+            self._Write(self._CHANGES_FILE, json.dumps(changes))
+
+    def GetStats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,135 @@
+"""Fields of the sources and how to read them from the raw payloads of GitHub's list responses.
+
+An object in a list response (eg. GET /repos/:owner/:repo/pulls) doesn't carry
+every field of the full object. Reading one of the others through PyGithub
+makes it GET the full object, that is one extra request per row.
+
+Sample Usage:
+    print(GetListedFields(u"pulls"))
+    print(GetCompletionFields(u"pulls", [u"title", u"additions"]))
+    print(Project(u"pulls", pull._rawData, [u"title", u"user"], lambda field: getattr(pull, field)))
+"""
+
+import _strptime  # strptime imports it lazily, which isn't thread-safe (Python issue 7980)
+import datetime
+
+
+def ParseDatetime(val):
+    """Parses a timestamp the way PyGithub does."""
+    if len(val) == 24:
+        return datetime.datetime.strptime(val, "%Y-%m-%dT%H:%M:%S.000Z")
+    elif len(val) >= 25:
+        return datetime.datetime.strptime(val[:19], "%Y-%m-%dT%H:%M:%S") + (1 if val[19] == "-" else -1) * datetime.timedelta(hours=int(val[20:22]), minutes=int(val[23:25]))
+    else:
+        return datetime.datetime.strptime(val, "%Y-%m-%dT%H:%M:%SZ")
+
+def _Login(user):
+    return user.get(u"login")
+
+def _Logins(users):
+    return [user.get(u"login") for user in users]
+
+def _Name(obj):
+    return obj.get(u"name")
+
+def _Names(objs):
+    return [obj.get(u"name") for obj in objs]
+
+def _Ref(part):
+    return part.get(u"ref")
+
+def _Shas(commits):
+    return [commit.get(u"sha") for commit in commits]
+
+def _RepoName(url):
+    return url.split(u"/")[-3]  # eg. https://api.github.com/repos/servo/servo/issues/1
+
+
+OBJECT = object()  # in the list payload, but left to PyGithub to make an object of
+
+# source -> {field: conversion of the raw value (None = as is)}, for the fields in list responses
+LISTED_FIELDS = {
+    u"repos": {u"archive_url": None, u"archived": None, u"assignees_url": None, u"blobs_url": None,
+               u"branches_url": None, u"clone_url": None, u"collaborators_url": None, u"comments_url": None,
+               u"commits_url": None, u"compare_url": None, u"contents_url": None, u"contributors_url": None,
+               u"created_at": ParseDatetime, u"default_branch": None, u"description": None,
+               u"downloads_url": None, u"events_url": None, u"fork": None, u"forks": None,
+               u"forks_count": None, u"forks_url": None, u"full_name": None, u"git_commits_url": None,
+               u"git_refs_url": None, u"git_tags_url": None, u"git_url": None, u"has_downloads": None,
+               u"has_issues": None, u"has_projects": None, u"has_wiki": None, u"homepage": None,
+               u"hooks_url": None, u"html_url": None, u"id": None, u"issue_comment_url": None,
+               u"issue_events_url": None, u"issues_url": None, u"keys_url": None, u"labels_url": None,
+               u"language": None, u"languages_url": None, u"merges_url": None, u"milestones_url": None,
+               u"mirror_url": None, u"name": None, u"notifications_url": None, u"open_issues": None,
+               u"open_issues_count": None, u"owner": _Login, u"permissions": OBJECT, u"private": None,
+               u"pulls_url": None, u"pushed_at": ParseDatetime, u"size": None, u"ssh_url": None,
+               u"stargazers_count": None, u"stargazers_url": None, u"statuses_url": None,
+               u"subscribers_url": None, u"subscription_url": None, u"svn_url": None, u"tags_url": None,
+               u"teams_url": None, u"trees_url": None, u"updated_at": ParseDatetime, u"url": None,
+               u"watchers": None, u"watchers_count": None},
+    u"issues": {u"active_lock_reason": None, u"assignee": _Login, u"assignees": _Logins, u"body": None,
+                u"closed_at": ParseDatetime, u"comments": None, u"comments_url": None,
+                u"created_at": ParseDatetime, u"events_url": None, u"html_url": None, u"id": None,
+                u"labels": _Names, u"labels_url": None, u"locked": None, u"milestone": OBJECT, u"number": None,
+                u"pull_request": OBJECT, u"repo": _RepoName, u"state": None, u"title": None, u"updated_at": ParseDatetime,
+                u"url": None, u"user": _Login},
+    u"pulls": {u"assignee": _Login, u"assignees": _Logins, u"base": _Ref, u"body": None,
+               u"closed_at": ParseDatetime, u"comments_url": None, u"commits_url": None,
+               u"created_at": ParseDatetime, u"diff_url": None, u"head": _Ref, u"html_url": None, u"id": None,
+               u"issue_url": None, u"labels": _Names, u"merge_commit_sha": None, u"merged_at": ParseDatetime,
+               u"milestone": OBJECT, u"number": None, u"patch_url": None, u"repo": _RepoName, u"review_comment_url": None,
+               u"review_comments_url": None, u"state": None, u"title": None, u"updated_at": ParseDatetime,
+               u"url": None, u"user": _Login},
+    u"commits": {u"author": _Name, u"committer": _Name, u"html_url": None, u"login": _Login,
+                 u"message": None, u"parents": _Shas, u"repo": _RepoName, u"sha": None, u"tree": OBJECT, u"url": None}}
+
+# source -> fields only in full objects (one extra request per row)
+COMPLETION_FIELDS = {
+    u"repos": [u"allow_merge_commit", u"allow_rebase_merge", u"allow_squash_merge", u"master_branch",
+               u"network_count", u"organization", u"parent", u"source", u"subscribers_count", u"topics"],
+    u"issues": [u"closed_by", u"repository"],
+    u"pulls": [u"additions", u"changed_files", u"comments", u"commits", u"deletions", u"mergeable",
+               u"mergeable_state", u"merged", u"merged_by", u"review_comments"],
+    u"commits": []}
+
+# source -> {field: where it is in the raw payload}, if not at the top level under its own name
+_PATHS = {u"issues": {u"repo": (u"url",)},
+          u"pulls": {u"repo": (u"url",)},
+          u"commits": {u"author": (u"commit", u"author"),
+                       u"committer": (u"commit", u"committer"),
+                       u"login": (u"author",),
+                       u"message": (u"commit", u"message"),
+                       u"repo": (u"url",),
+                       u"tree": (u"commit", u"tree"),
+                       u"url": (u"commit", u"url")}}
+
+_MISSING = object()
+
+
+def GetListedFields(source):
+    """Returns the fields of source (sorted) which come in list responses, what "*" selects."""
+    return sorted(LISTED_FIELDS[source])
+
+def GetCompletionFields(source, fields):
+    """Returns the fields which cost one extra request per row."""
+    completion_fields = COMPLETION_FIELDS.get(source, [])
+    return [field for field in fields if field in completion_fields]
+
+def Project(source, raw, fields, fallback):
+    """Returns the values of fields read from raw, a payload in a list response of source.
+
+    fallback(field) reads the fields that aren't there or have to be PyGithub objects.
+    """
+    listed_fields = LISTED_FIELDS[source]
+    paths = _PATHS.get(source, {})
+    vals = []
+    for field in fields:
+        convert = listed_fields.get(field, OBJECT)
+        val = raw
+        for key in paths.get(field, (field,)):
+            val = val.get(key, _MISSING) if isinstance(val, dict) else _MISSING
+        if convert is OBJECT or val is _MISSING:
+            vals.append(fallback(field))
+        else:
+            vals.append(val if convert is None or val is None else convert(val))
+    return vals
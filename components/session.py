@@ -6,19 +6,20 @@ Sample Usage:
     print(s.Execute())
 """
 
+import join
 import table as tb
 import table_fetcher
 from expression import SgExpression
 from grouping import SgGrouping
+from grouping import SgHashAggregation
 from ordering import SgOrdering
 from ordering import SgTableOrdering
 
 
-# TODO(lnishan): Change it to SgSessionSimple and add SgSession to handle unions and joins.
 class SgSession:
     """A class for SQLGitHub sessions."""
 
-    def __init__(self, github, field_exprs, source=None, condition=None, groups=None, having=None, orders=None, limit=None):
+    def __init__(self, github, field_exprs, source=None, condition=None, groups=None, having=None, orders=None, limit=None, fetch_options=None, max_staleness=None):
         self._field_exprs = field_exprs
         self._source = source
         self._condition = condition
@@ -26,6 +27,8 @@ class SgSession:
         self._having = having
         self._orders = orders
         self._limit = limit
+        self._max_staleness = max_staleness  # seconds, answer from the replica if it's at most this old
+        self._explainer = None  # SgExplainer measuring the stages (EXPLAIN ANALYZE)
 
         rel_keys = SgExpression.ExtractTokensFromExpressions(self._field_exprs)
         if self._condition:
@@ -39,18 +42,201 @@ class SgSession:
         rel_keys = list(set(rel_keys))
         if u"*" in rel_keys:
             rel_keys = [u"*"]
-        self._fetcher = table_fetcher.SgTableFetcher(github, rel_keys)
+        self._fetcher = table_fetcher.SgTableFetcher(github, rel_keys, **(fetch_options or {}))
+        # fields costing a request per row, only requested for the rows left after where (and limit)
+        self._late_fields = self._fetcher.GetCompletionFields(self._source) if isinstance(self._source, basestring) else []
+        self._early_conjuncts, self._late_conjuncts = self._SplitCondition()
+        if isinstance(self._source, join.SgJoin):
+            self._source.SetRelKeys(rel_keys)
+
+    def _SplitCondition(self):
+        """Returns the programs of the conjuncts of where (reading no late field, reading some)."""
+        early, late = [], []
+        if self._condition and self._late_fields:
+            for program in SgExpression.SplitConjuncts(SgExpression.Compile(self._condition)):
+                (late if set(SgExpression.GetFields(program)) & set(self._late_fields) else early).append(program)
+        return early, late
+
+    def _GetWhereLateFields(self):
+        """Returns the late fields where reads."""
+        fields = set(field for program in self._late_conjuncts for field in SgExpression.GetFields(program))
+        return [field for field in self._late_fields if field in fields]
+
+    def _GetRowLimit(self):
+        """Returns how many rows the (ungrouped, non-aggregated) result is cut to before select (None = all)."""
+        if not self._limit or self._groups or self._having:
+            return None
+        if u"*" not in self._field_exprs and SgExpression.IsAllTokensInAggregate(self._field_exprs):
+            return None
+        return self._limit
+
+    def _GetFetchLimit(self):
+        """Returns how many rows meeting the condition the source has to provide (None = all)."""
+        return self._GetRowLimit() if not self._orders and not self._late_conjuncts else None
+
+    def _GetAggregation(self):
+        """Returns a SgHashAggregation of select, having and order by expressions, None if they need the rows of each group."""
+        check_exprs = [expr for expr in self._field_exprs if expr not in self._groups] if self._groups else self._field_exprs
+        if not SgExpression.IsAllTokensInAggregate(check_exprs):
+            return None  # not one row per group
+        exprs = self._field_exprs + ([self._having] if self._having else []) + (self._orders[0] if self._orders else [])
+        aggregation = SgHashAggregation(exprs, self._groups)
+        return aggregation if aggregation.IsSupported() else None
+
+    def _FilterLate(self, table):
+        """Evaluates where, requesting the late fields it reads only for the rows meeting the other conjuncts."""
+        for program in self._early_conjuncts:
+            if not len(table):
+                return table
+            table = table.FilterRows(SgExpression.EvaluateConditionProgram(table, program, self._condition))
+        if self._late_conjuncts and len(table):
+            table = self._fetcher.Materialize(self._source, table, self._GetWhereLateFields())
+            for program in self._late_conjuncts:
+                if not len(table):
+                    break
+                table = table.FilterRows(SgExpression.EvaluateConditionProgram(table, program, self._condition))
+        return table
+
+    def _GetMaterializeLimit(self):
+        """Returns how many rows the late fields are requested for (None = all), the top ones if there's order by."""
+        if self._orders and set(SgExpression.ExtractTokensFromExpressions(self._orders[0])) & set(self._late_fields):
+            return None  # the top rows are only known with the late fields
+        return self._GetRowLimit()
+
+    def _Materialize(self, table):
+        """Adds the late fields where didn't read, for the rows left (up to the limit if that's all the result needs)."""
+        late_fields = [field for field in self._late_fields if field not in table.GetFields()]
+        if not late_fields:
+            return table
+        self._Begin(u"materialize", len(table))
+        limit = self._GetMaterializeLimit()
+        if limit and limit < len(table):
+            if self._orders:  # the top rows, in order (sorted again, stably, with the other rows of the result)
+                table = SgOrdering(table.Chain(SgExpression.EvaluateExpressions(table, self._orders[0])), self._orders[1]).Sort(limit=limit)
+            else:
+                table = table.FilterRows([idx < limit for idx in xrange(len(table))])
+        table = self._fetcher.Materialize(self._source, table, late_fields)
+        self._End(len(table))
+        return table
+
+    def _Begin(self, stage, rows_in=None):
+        if self._explainer:
+            self._explainer.Begin(stage, rows_in)
+
+    def _End(self, rows_out):
+        if self._explainer:
+            self._explainer.End(rows_out)
+
+    def _Aggregate(self, table, aggregation):
+        self._Begin(u"group", len(table))
+        res_table = aggregation.Aggregate(table)
+        self._End(len(res_table))
+        num_fields = len(self._field_exprs)
+        if self._having:
+            self._Begin(u"having", len(res_table))
+            res_table.SetTable([row[:num_fields] + row[num_fields + 1:] for row in res_table if row[num_fields]])
+            res_table.SetFields(res_table.GetFields()[:num_fields] + res_table.GetFields()[num_fields + 1:])
+            self._End(len(res_table))
+        if self._orders:
+            self._Begin(u"order", len(res_table))
+            res_table = SgOrdering(res_table, self._orders[1]).Sort(limit=self._limit)
+            self._End(len(res_table))
+        if self._limit:
+            self._Begin(u"limit", len(res_table))
+            res_table.SetTable(res_table[:self._limit])
+            self._End(len(res_table))
+        return res_table
 
     def _GetEmptyTable(self):
         table = tb.SgTable()
         table.SetFields(self._field_exprs)
         return table
 
-    def Execute(self):
-        # source is either a label (eg. "google.issues") or a SgSession
+    def GetPlan(self):
+        """Returns [(stage, detail)] of the stages the session goes through (before knowing any rows)."""
+        plan = []
+        if isinstance(self._source, SgSession):
+            plan.append((u"fetch", u"subquery"))
+        elif isinstance(self._source, join.SgJoin):
+            plan.append((u"fetch", self._source.Describe(self._condition)))
+        elif self._source:
+            plan.append((u"fetch", self._fetcher.Describe(self._source, self._condition, self._GetFetchLimit(), self._max_staleness, self._late_fields)))
+        else:
+            plan.append((u"fetch", u"no source, one dummy row"))
+        if self._condition:
+            plan.append((u"where", self._condition + (u", in the join" if isinstance(self._source, join.SgJoin) else u"")))
+        if self._late_conjuncts:
+            plan[-1] = (u"where", plan[-1][1] + u", " + self._fetcher.DescribeMaterialize(self._GetWhereLateFields()) +
+                        u" after the other conjuncts")
+        late_fields = [field for field in self._late_fields if field not in self._GetWhereLateFields()]
+        if late_fields:
+            limit = self._GetMaterializeLimit()
+            plan.append((u"materialize", self._fetcher.DescribeMaterialize(late_fields) +
+                         (u", for the %s %d rows" % (u"top" if self._orders else u"first", limit) if limit else u"")))
+        aggregation = self._GetAggregation()
+        if aggregation:
+            plan.append((u"group", u"hash aggregation%s, one pass keeping accumulators per group" % (u" by " + u", ".join(self._groups) if self._groups else u"")))
+        else:
+            plan.append((u"project", u"evaluates the fields of the expressions"))
+            if self._groups:
+                plan.append((u"group", u"one table per group by " + u", ".join(self._groups)))
+        if self._having:
+            plan.append((u"having", self._having))
+        if self._orders:
+            limit = self._limit if aggregation else self._GetRowLimit()
+            plan.append((u"order", u", ".join(u"%s %s" % (expr, u"ASC" if reverse == 1 else u"DESC") for expr, reverse in zip(*self._orders)) +
+                         (u", top %d with a bounded heap" % limit if limit else u"")))
+        if not aggregation:
+            plan.append((u"select", u", ".join(self._field_exprs)))
+        if self._limit:
+            plan.append((u"limit", unicode(self._limit)))
+        return plan
+
+    def Measure(self, explainer):
+        """Executes the session, measuring its stages with explainer, returns the result."""
+        self._explainer = explainer
+        try:
+            return self._Execute()
+        finally:
+            self._explainer = None
+
+    def Explain(self, explainer):
+        """Executes the session, measuring its stages with explainer, returns the table of the measurements."""
+        self.Measure(explainer)
+        return explainer.GetTable(dict(self.GetPlan()))
+
+    def SetMetrics(self, metrics):
+        """Records the listings of every fetcher of the session, its subquery's or join's included, in metrics (None to stop)."""
+        self._fetcher.SetMetrics(metrics)
+        if isinstance(self._source, (SgSession, join.SgJoin)):
+            self._source.SetMetrics(metrics)
+
+    def Execute(self, metrics=None):
+        """Executes the session, recording its stages, listings and expression timings in metrics (a SgMetrics) if given."""
+        if metrics is None:
+            return self._Execute()
+        self._explainer = metrics
+        self.SetMetrics(metrics)
+        SgExpression.SetTimer(metrics.AddExpressionTime)
+        try:
+            return self._Execute()
+        finally:
+            SgExpression.SetTimer(None)
+            self.SetMetrics(None)
+            self._explainer = None
+
+    def _Execute(self):
+        # source is either a label (eg. "google.issues"), a SgSession or a SgJoin (which evaluates where itself)
+        self._Begin(u"fetch")
         if self._source:
-            source_table = self._source.Execute() if isinstance(self._source, SgSession) else self._fetcher.Fetch(self._source)
-            if not source_table[:]:
+            if isinstance(self._source, SgSession):
+                source_table = self._source.Execute()
+            elif isinstance(self._source, join.SgJoin):
+                source_table = self._source.Fetch(self._condition)
+            else:
+                source_table = self._fetcher.Fetch(self._source, self._condition, self._GetFetchLimit(), self._max_staleness, late_fields=self._late_fields)
+            self._End(len(source_table))
+            if not len(source_table):
                 return self._GetEmptyTable()
             else:
                 if u"*" in self._field_exprs:
@@ -59,19 +245,26 @@ class SgSession:
             source_table = tb.SgTable()
             source_table.SetFields([u"Dummy Field"])
             source_table.Append([u"Dummy Value"])
+            self._End(len(source_table))
 
         # evaluate where
-        if self._condition:
-            filtered_table = tb.SgTable()
-            filtered_table.SetFields(source_table.GetFields())
-            meets = SgExpression.EvaluateExpression(source_table, self._condition)
-            for i, row in enumerate(source_table):
-                if meets[i]:
-                    filtered_table.Append(row)
+        if self._condition and not isinstance(self._source, join.SgJoin):
+            self._Begin(u"where", len(source_table))
+            if self._late_fields:
+                filtered_table = self._FilterLate(source_table)
+            else:
+                filtered_table = source_table.FilterRows(SgExpression.EvaluateCondition(source_table, self._condition))
+            self._End(len(filtered_table))
         else:
             filtered_table = source_table
-        if not filtered_table[:]:
+        if not len(filtered_table):
             return self._GetEmptyTable()
+        filtered_table = self._Materialize(filtered_table)
+
+        # group by & aggregate functions, with only accumulator state per group when possible
+        aggregation = self._GetAggregation()
+        if aggregation:
+            return self._Aggregate(filtered_table, aggregation)
         
         # evaluate all necessary expressions
         # in reversed order because we process from the rightmost item first
@@ -85,34 +278,43 @@ class SgSession:
             eval_exprs += having_tokens
         if self._groups:
             eval_exprs += self._groups
+        self._Begin(u"project", len(filtered_table))
         res_table = SgExpression.EvaluateExpressions(filtered_table, eval_exprs)
+        self._End(len(res_table))
 
         # group by
         if self._groups:
+            self._Begin(u"group", len(res_table))
             res_tables = SgGrouping.GenerateGroups(res_table, self._groups)
+            self._End(len(res_tables))
         else:
             res_tables = [res_table]
 
         # having
         if self._having:
+            self._Begin(u"having", len(res_tables))
             filtered_tables = []
             for table in res_tables:
                 if all(SgExpression.EvaluateExpression(table, self._having)):
                     filtered_tables.append(table.SliceCol(0, len(table.GetFields()) - len(having_tokens)))
             res_tables = filtered_tables
+            self._End(len(res_tables))
 
         # order by
         if self._orders:
+            self._Begin(u"order", sum(len(table) for table in res_tables))
             for table in res_tables:
                 table.Copy(table.SliceCol(0, len(table.GetFields()) - len(order_tokens)).Chain(SgExpression.EvaluateExpressions(table, self._orders[0])))
                 ordering = SgOrdering(table, self._orders[1])
-                table.Copy(ordering.Sort(keep_order_fields=True))
+                table.Copy(ordering.Sort(keep_order_fields=True, limit=self._GetRowLimit()))
             ordering = SgTableOrdering(res_tables, self._orders[1])
-            res_tables = ordering.Sort()
+            res_tables = ordering.Sort(limit=self._limit)
+            self._End(sum(len(table) for table in res_tables))
 
         # TODO(lnishan): Support having here
 
         # process select
+        self._Begin(u"select", sum(len(table) for table in res_tables))
         for table in res_tables:
             table.Copy(SgExpression.EvaluateExpressions(table, self._field_exprs))
 
@@ -127,9 +329,34 @@ class SgSession:
         for table in res_tables:
             for row in table:
                 merged_table.Append(row)
+        self._End(len(merged_table))
 
         # process limit
         if self._limit:
+            self._Begin(u"limit", len(merged_table))
             merged_table.SetTable(merged_table[:self._limit])
+            self._End(len(merged_table))
 
         return merged_table
+
+    def GetCompletionFields(self):
+        """Returns the fields to fetch which cost one extra request per row."""
+        if isinstance(self._source, (SgSession, join.SgJoin)):
+            return self._source.GetCompletionFields()
+        return self._fetcher.GetCompletionFields(self._source) if self._source else []
+
+    def GetSources(self):
+        """Returns the (org, source type) pairs the result is computed from."""
+        if isinstance(self._source, (SgSession, join.SgJoin)):
+            return self._source.GetSources()
+        return self._fetcher.GetSources(self._source) if self._source else []
+
+    def GetMaxStaleness(self):
+        if isinstance(self._source, join.SgJoin):
+            return self._source.GetMaxStaleness()
+        return self._max_staleness
+
+    def GetStats(self):
+        if isinstance(self._source, join.SgJoin):
+            return self._source.GetStats()
+        return self._fetcher.GetStats()
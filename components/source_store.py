@@ -0,0 +1,128 @@
+"""A bounded in-memory store of fetched source tables, shared by the queries of a session.
+
+A table is stored under its label (eg. "servo.issues.closed.30"), the API parameters
+it was pre-filtered with and its fields. A later query on the label reuses it if it
+needs no more fields, and the table is either pre-filtered the same way or not at all.
+Tables expire after the HTTP cache TTL of their sources, the next query fetches
+them again (revalidating the cached responses).
+
+Sample Usage:
+    store = SgSourceStore(64 * 1024 * 1024)
+    store.Put(u"servo.issues", {}, [u"title", u"user"], [(u"servo", u"repos"), (u"servo", u"issues")], table)
+    print(store.Get(u"servo.issues", {}, [u"title"]))
+    store.Invalidate(u"servo", u"issues")
+"""
+
+import collections
+import sys
+import threading
+import time
+
+import http_cache
+import table as tb
+
+
+def _GetDeepSize(val):
+    size = sys.getsizeof(val)
+    if isinstance(val, (list, tuple)):
+        size += sum(_GetDeepSize(item) for item in val)
+    elif isinstance(val, dict):
+        size += sum(_GetDeepSize(key) + _GetDeepSize(item) for key, item in val.items())
+    return size
+
+
+class _Entry:
+
+    def __init__(self, fields, sources, table, size, expires_at):
+        self.fields = fields
+        self.sources = sources
+        self.table = table
+        self.size = size
+        self.expires_at = expires_at
+
+
+class SgSourceStore:
+    """A bounded in-memory store of fetched source tables, shared by the queries of a session."""
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # in bytes (estimated)
+
+    _SAMPLE_ROWS = 64  # rows measured to estimate the size of a table
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttls=None):
+        """ttls overrides http_cache.SgHttpCache.DEFAULT_TTLS, like the ttls of the HTTP cache."""
+        self._max_size = max_size
+        self._ttls = dict(http_cache.SgHttpCache.DEFAULT_TTLS)
+        self._ttls.update(ttls or {})
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # (label, params, fields) -> _Entry, least recently used first
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _GetParamsKey(self, params):
+        return tuple(sorted((key, tuple(val) if isinstance(val, list) else val) for key, val in params.items()))
+
+    def _EstimateSize(self, table):
+        rows = len(table)
+        if not rows:
+            return 0
+        sample = table[::max(1, rows // self._SAMPLE_ROWS)]
+        return sum(_GetDeepSize(row) for row in sample) * rows // len(sample)
+
+    def _Remove(self, key):
+        """Removes an entry (lock held)."""
+        self._size -= self._entries.pop(key).size
+
+    def Get(self, label, params, fields):
+        """Returns a table of fields of label pre-filtered with params, None if there's no such table stored."""
+        params_key = self._GetParamsKey(params)
+        now = time.time()
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.expires_at <= now:
+                    self._Remove(key)
+                    self._stats["expirations"] += 1
+                elif key[0] == label.lower() and key[1] in (params_key, ()) and set(fields) <= set(entry.fields):
+                    self._entries[key] = self._entries.pop(key)  # most recently used
+                    self._stats["hits"] += 1
+                    table = tb.SgTable()
+                    table.SetFields(list(fields))
+                    if len(entry.table):
+                        table.SetCols([entry.table.GetVals(field) for field in fields], len(entry.table))
+                    return table
+            self._stats["misses"] += 1
+            return None
+
+    def Put(self, label, params, fields, sources, table):
+        """Stores a table of fields of label pre-filtered with params, computed from sources, a list of (org, source)."""
+        stored = tb.SgTable()
+        if len(table):
+            stored.Copy(table)  # shares the columns, copied before either table modifies them
+        stored.SetFields(list(fields))
+        size = self._EstimateSize(stored)
+        if size > self._max_size:
+            return
+        key = (label.lower(), self._GetParamsKey(params), tuple(sorted(fields)))
+        with self._lock:
+            for other_key, entry in self._entries.items():  # tables with a subset of the fields aren't needed anymore
+                if other_key[:2] == key[:2] and set(entry.fields) <= set(fields):
+                    self._Remove(other_key)
+            ttl = min([self._ttls.get(source, self._ttls["default"]) for _, source in sources] or [self._ttls["default"]])
+            self._entries[key] = _Entry(list(fields), [(org.lower(), source) for org, source in sources], stored, size, time.time() + ttl)
+            self._size += size
+            while self._size > self._max_size:
+                self._Remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def Invalidate(self, org, source):
+        """Drops the tables computed from source (eg. u"issues") of org."""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if (org.lower(), source) in entry.sources:
+                    self._Remove(key)
+
+    def GetStats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["size"] = self._size
+            return stats
@@ -20,6 +20,7 @@ Sample Usage:
 """
 
 import itertools
+import re
 
 
 class EscapeHtml:
@@ -29,6 +30,7 @@ class EscapeHtml:
                u"\"": u"&quot;",
                u"\'": u"&#39;",
                u"\n": u"<br>\n"}
+    _TRANSLATION = dict((ord(ch), escaped) for ch, escaped in MAPPING.items())  # for unicode.translate
 
     @classmethod
     def Escape(cls, ch):
@@ -36,64 +38,77 @@ class EscapeHtml:
 
     @classmethod
     def EscapeUnicodeStr(cls, unicode_str):
-        ret = u""
-        for ch in unicode_str:
-            ret += cls.Escape(ch)
-        return ret
+        return unicode_str.translate(cls._TRANSLATION)
 
 
-class SgTable:
-    """A class to store tables."""
+class SgTable(object):
+    """A class to store tables.
+
+    Values are stored column by column. Tables returned by SliceCol, Chain and Copy
+    share columns with their source, a column is copied before it's modified (copy-on-write).
+    """
+
+    __slots__ = ("_fields", "_index", "_columns", "_rows", "_shared")
+
+    _WRITE_CHUNK = 512  # pieces of output (eg. rows) buffered before each write
+    # a string starts with either quote and ends at the next unescaped one (of either kind)
+    _COMMA_OUT_OF_STRING_REGEX = re.compile(r"""(?:[^,"']|["'](?:\\.|[^"'\\])*["'])*,""")
 
     def __init__(self):
         self._fields = []
-        self._table = []
+        self._index = {}  # field -> column index (of its first occurrence)
+        self._columns = []
+        self._rows = 0
+        self._shared = False  # whether _columns may be referenced by another table
+
+    def _MakeRows(self, columns, rows):
+        if not columns:
+            return [[] for _ in range(rows)]
+        return [list(row) for row in itertools.izip(*columns)]
+
+    def _Unshare(self):
+        if self._shared:
+            self._columns = [list(column) for column in self._columns]
+            self._shared = False
 
     def __len__(self):
-        return len(self._table)
+        return self._rows
 
     def __iter__(self):
-        for row in self._table:
-            yield row
+        if not self._columns:
+            for _ in range(self._rows):
+                yield []
+        for row in itertools.izip(*self._columns):
+            yield list(row)
 
     def __getitem__(self, key):
         if isinstance(key, slice):
-            return self._table[key.start:key.stop:key.step]
+            return self._MakeRows([column[key.start:key.stop:key.step] for column in self._columns],
+                                  len(xrange(*key.indices(self._rows))))
         else:
-            if not ((type(key) == int or type(key) == long) and key >= 0 and key < len(self._table)):
+            if not ((type(key) == int or type(key) == long) and key >= 0 and key < self._rows):
                 raise ValueError("Index illegal")
             else:
-                return self._table[key]
+                return [column[key] for column in self._columns]
 
     def __setitem__(self, key, value):
-        if not ((type(key) == int or type(key) == long) and key >= 0 and key < len(self._table)):
+        if not ((type(key) == int or type(key) == long) and key >= 0 and key < self._rows):
             raise ValueError("Index illegal")
         else:
-            self._table[key] = value
+            self._Unshare()
+            for column, val in itertools.izip(self._columns, value):
+                column[key] = val
 
     def __str__(self):
-        ret = str(self._fields)
-        for row in self._table:
-            ret += "\n" + str(row)
-        return ret
+        return "\n".join(self._IterStr())
+
+    def _IterStr(self):
+        yield str(self._fields)
+        for row in self:
+            yield str(row)
 
     def __HasCommaOutOfString(self, val):
-        in_string = False
-        is_escaping = False
-        for ch in val:
-            if in_string:
-                if is_escaping:
-                    is_escaping = False
-                elif ch == u"\\":
-                    is_escaping = True
-                elif ch in (u"\"", u"\'"):
-                    in_string = False
-            else:
-                if ch == u",":
-                    return True
-                elif ch in (u"\"", u"\'"):
-                    in_string = True
-        return False
+        return u"," in val and self._COMMA_OUT_OF_STRING_REGEX.match(val) is not None
 
     def _GetCsvRepr(self, val):
         if isinstance(val, list):
@@ -107,63 +122,119 @@ class SgTable:
             else:
                 return unicode(str(val), "utf-8")
 
+    def _IterCsv(self):
+        yield self._GetCsvRepr(self._fields)
+        for row in self:
+            yield self._GetCsvRepr(row)
+
+    def _IterHtml(self):
+        yield u"<html>\n<head><meta charset=\"utf-8\">\n<title>SQLGitHub Result</title>\n</head>\n<body>\n"
+        yield u"<table border=1><tr>" + u"".join(u"<td>" + EscapeHtml.EscapeUnicodeStr(field) + u"</td>" for field in self._fields) + u"</tr>\n"
+        for row in self:
+            yield u"<tr>" + u"".join(u"<td>" + EscapeHtml.EscapeUnicodeStr(val if isinstance(val, unicode) else unicode(str(val), "utf-8")) + u"</td>" for val in row) + u"</tr>\n"
+        yield u"</table>\n</html>"
+
+    def _Write(self, f, pieces, sep):
+        """Writes pieces (followed by sep) to a file object in chunks, unicode is encoded in UTF-8."""
+        chunk = []
+        for piece in pieces:
+            chunk.append(piece)
+            if len(chunk) == self._WRITE_CHUNK:
+                self._WriteChunk(f, chunk, sep)
+                chunk = []
+        self._WriteChunk(f, chunk, sep)
+        f.flush()
+
+    def _WriteChunk(self, f, chunk, sep):
+        if chunk:
+            data = sep.join(chunk) + sep
+            f.write(data.encode("utf-8") if isinstance(data, unicode) else data)
+
     def InCsv(self):
-        ret = self._GetCsvRepr(self._fields)
-        for row in self._table:
-            ret += u"\n" + self._GetCsvRepr(row)
-        return ret
+        return u"\n".join(self._IterCsv())
 
     def InHtml(self):
-        ret = u"<html>\n<head><meta charset=\"utf-8\">\n<title>SQLGitHub Result</title>\n</head>\n<body>\n"
-
-        ret += u"<table border=1>"
-        ret += u"<tr>"
-        for field in self._fields:
-            ret += u"<td>" + EscapeHtml.EscapeUnicodeStr(field) + u"</td>"
-        ret += u"</tr>\n"
-        for row in self._table:
-            ret += u"<tr>"
-            for val in row:
-                unicode_str = val if isinstance(val, unicode) else unicode(str(val), "utf-8")
-                ret += u"<td>" + EscapeHtml.EscapeUnicodeStr(unicode_str) + u"</td>"
-            ret += u"</tr>\n"
-        ret += u"</table>\n</html>"
-        return ret
+        return u"".join(self._IterHtml())
+
+    def WriteStr(self, f):
+        """Writes the table as print(table) would, row by row."""
+        self._Write(f, self._IterStr(), "\n")
+
+    def WriteCsv(self, f):
+        """Writes the table in CSV (UTF-8) as print(table.InCsv()) would, row by row."""
+        self._Write(f, self._IterCsv(), u"\n")
+
+    def WriteHtml(self, f):
+        """Writes the table in HTML (UTF-8) as print(table.InHtml()) would, row by row."""
+        self._Write(f, itertools.chain(self._IterHtml(), [u"\n"]), u"")
 
     def GetVals(self, field):
-        idx = [i for i, f in enumerate(self._fields) if f == field][0]
-        return [row[idx] for row in self._table]
+        """Returns the column of field (shared with the table, don't modify it)."""
+        self._shared = True
+        return self._columns[self._index[field]]
+
+    def GetCols(self):
+        """Returns the list of columns (shared with the table, don't modify them)."""
+        self._shared = True
+        return self._columns
+
+    def SetCols(self, columns, rows=None):
+        self._columns = columns
+        self._rows = len(columns[0]) if rows is None and columns else rows or 0
+        self._shared = True
 
     def Copy(self, table):
         self.SetFields(table.GetFields())
-        self.SetTable(table.GetTable())
-    
+        self.SetCols(table.GetCols(), len(table))
+
     def Append(self, row):
-        self._table.append(row)
+        if not self._rows and not self._columns:
+            self._columns = [[] for _ in row]
+            self._shared = False
+        self._Unshare()
+        for column, val in itertools.izip(self._columns, row):
+            column.append(val)
+        self._rows += 1
 
     def GetTable(self):
-        return self._table
+        return self._MakeRows(self._columns, self._rows)
 
     def SetTable(self, table):
-        self._table = table
+        self._columns = [list(column) for column in itertools.izip(*table)]
+        self._rows = len(table)
+        self._shared = False
 
     def GetFields(self):
         return self._fields
 
     def SetFields(self, fields):
         self._fields = fields
-    
+        self._index = {}
+        for idx, field in enumerate(fields):
+            self._index.setdefault(field, idx)
+
+    def FilterRows(self, meets):
+        """Returns a table of the rows i where meets[i] is true."""
+        table = SgTable()
+        table.SetFields(self._fields)
+        if all(meets):
+            table.SetCols(self.GetCols(), self._rows)
+        else:
+            table.SetCols([list(itertools.compress(column, meets)) for column in self._columns], sum(1 for meet in meets if meet))
+        return table
+
     def SliceCol(self, start, end):
         table = SgTable()
         table.SetFields(self._fields[start:end])
-        for row in self._table:
-            table.Append(row[start:end])
+        table.SetCols(self.GetCols()[start:end], self._rows)
         return table
 
     def Chain(self, table):
         res_table = SgTable()
         res_table.SetFields(self._fields + table.GetFields())
-        rows = min(len(self._table), len(table))
-        for i in range(rows):
-            res_table.Append(self._table[i] + table[i])
+        rows = min(self._rows, len(table))
+        columns = self.GetCols() + table.GetCols()
+        if rows != self._rows or rows != len(table):
+            columns = [column[:rows] for column in columns]
+        res_table.SetCols(columns, rows)
         return res_table
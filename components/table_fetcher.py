@@ -13,28 +13,111 @@ Sample Usage:
 
 import datetime
 import inspect
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
 
 from github.Commit import Commit
 from github.File import File
 from github.GitAuthor import GitAuthor
+from github.GitCommit import GitCommit
 from github.Issue import Issue
 from github.Label import Label
 from github.NamedUser import NamedUser
 from github.Organization import Organization
+from github.PaginatedList import PaginatedList
 from github.PullRequest import PullRequest
 from github.PullRequestPart import PullRequestPart
 from github.Repository import Repository
 
+import schema
 import table as tb
 import utilities as util
+from expression import SgExpression
+
+
+class _RowQuota:
+    """Counts the rows passing a condition in every listing to stop fetching once a LIMIT is met.
+
+    Listing idx only needs limit - (passing rows of the listings before it),
+    so the rows needed are the same as in an exhaustive, sequential fetch.
+    """
+
+    def __init__(self, condition, limit, listings):
+        self._condition = condition
+        self._limit = limit
+        self._passed = [0] * listings
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.stopped = 0
+
+    def IsMet(self, idx):
+        with self._lock:
+            return sum(self._passed[:idx + 1]) >= self._limit
+
+    def Count(self, idx, fields, rows):
+        """Counts the passing rows in a chunk of listing idx, returns whether listing idx can stop."""
+        if self._condition:
+            table = tb.SgTable()
+            table.SetFields(fields)
+            table.SetTable(rows)
+            passed = sum(1 for meets in SgExpression.EvaluateCondition(table, self._condition) if meets)
+        else:
+            passed = len(rows)
+        with self._lock:
+            self._passed[idx] += passed
+        return self.IsMet(idx)
+
+    def Skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def Stop(self):
+        with self._lock:
+            self.stopped += 1
 
 
 class SgTableFetcher:
     """Fetches data from GitHub API, store and return the data in a SgTable."""
 
-    def __init__(self, github, rel_keys=None):
+    _MAX_CONCURRENCY = 32  # more concurrent requests than this trips GitHub's secondary rate limits
+
+    # WHERE comparisons GitHub can filter server-side: source -> {(field, operator): API parameter}
+    _PUSHDOWN_PARAMS = {u"issues": {(u"state", u"=="): "state",
+                                    (u"user", u"=="): "creator",
+                                    (u"assignee", u"=="): "assignee",
+                                    (u"labels", u"contains"): "labels"},
+                        u"pulls": {(u"state", u"=="): "state",
+                                   (u"base", u"=="): "base"},
+                        u"commits": {(u"login", u"=="): "author"}}
+
+    _REPLICATED_SOURCES = (u"issues", u"pulls", u"commits")
+
+    # classes of the full objects of the sources with fields that cost a request per row
+    # (none for commits, rows are read from their git commits, which have no stats or files)
+    _COMPLETED_CLASSES = {u"repos": Repository, u"issues": Issue, u"pulls": PullRequest}
+
+    # rows of a source in an org, rough orders of magnitude for planning (eg. the build side of a join)
+    _ROW_ESTIMATES = {None: 1, u"repos": 50, u"issues": 5000, u"pulls": 3000, u"commits": 20000}
+    _DAYS_ESTIMATED = 365  # days of activity in _ROW_ESTIMATES
+
+    def __init__(self, github, rel_keys=None, concurrency=1, replica=None, store=None):
         self._github = github
         self._rel_keys = rel_keys
+        self._concurrency = max(1, min(concurrency, self._MAX_CONCURRENCY))
+        self._page_concurrency = self._concurrency  # pages of a listing requested at once
+        self._replica = replica  # SgReplica answering queries "with max_staleness"
+        self._store = store  # SgSourceStore of the tables fetched by the session's queries
+        self._metrics = None  # SgMetrics recording the listings
+        self._page_size = getattr(github, "per_page", 30)
+        self._source = None  # eg. u"issues", fields are read from raw payloads for the sources in the schema
+        self._condition = None
+        self._limit = None
+        self._quota = None
+        self._repo_names = None  # lowercased names of the repos listed, all if None
+        self._late_fields = []  # fields left out of the listing, added with Materialize for the rows needed
+        self._stats = {"listings_skipped": 0, "listings_stopped": 0}
 
     def _Parse(self, label):
         tmp = label.split(".")
@@ -48,7 +131,11 @@ class SgTableFetcher:
     def _GetKeys(self, cls):
         if not u"*" in self._rel_keys:
             # TODO(lnishan): Might want to check for existence of every key in self._rel_keys
+            if self._late_fields:  # the url of each row is fetched instead, to request the full object later
+                return [key for key in self._rel_keys if key not in self._late_fields] + ([u"url"] if u"url" not in self._rel_keys else [])
             return self._rel_keys
+        elif self._source in schema.LISTED_FIELDS:
+            return schema.GetListedFields(self._source)  # reading the rest would request every object
         else:
             return [unicode(key, "utf-8") for key, val in inspect.getmembers(cls, lambda m: not inspect.ismethod(m)) if not key.startswith("_")]
 
@@ -74,6 +161,8 @@ class SgTableFetcher:
             return non_list.name
         elif isinstance(non_list, File):
             return non_list.filename
+        elif isinstance(non_list, GitCommit):
+            return non_list.sha
         else:
             return non_list
 
@@ -83,8 +172,16 @@ class SgTableFetcher:
         else:
             return self.__ConvertNonList(val)
 
+    def _Project(self, raw, get_obj):
+        """Returns the values of the fields read from raw, get_obj() returns the PyGithub object for the rest."""
+        to_obj = self._ToGitCommit if self._source == u"commits" else lambda obj: obj
+        return schema.Project(self._source, raw, self._GetKeys(None),
+                              lambda key: self.__ConvertVal(getattr(to_obj(get_obj()), key)))
+
     def _GetVals(self, cls):
-        if not u"*" in self._rel_keys:
+        if self._source in schema.LISTED_FIELDS:
+            return self._Project(cls._rawData, lambda: cls)
+        elif not u"*" in self._rel_keys:
             return [self.__ConvertVal(getattr(cls, key)) for key in self._rel_keys]
         else:
             return [self.__ConvertVal(val) for key, val in inspect.getmembers(cls, lambda m: not inspect.ismethod(m)) if not key.startswith("_")]
@@ -108,8 +205,34 @@ class SgTableFetcher:
         else:
             return int(info), None
 
+    def _ParseStateInfo(self, add_info):
+        state = u"open"
+        for info in add_info or []:
+            if info in (u"all", u"open", u"closed"):
+                state = info
+        return state
+
+    def _ParseDaysInfo(self, add_info):
+        days = None
+        for info in add_info or []:
+            if util.IsNumeric(info):
+                days = int(info)
+        return days
+
+    def _ParseDateRangeInfo(self, add_info):
+        days_start, days_end = None, None
+        for info in add_info or []:
+            if self._IsDateRange(info):
+                days_start, days_end = self._ParseDateRange(info)
+        return days_start, days_end
+
+    def _GetTimestampDaysBefore(self, days):
+        """Returns the UTC timestamp of days ago, formatted like the ones in GitHub's payloads."""
+        return (datetime.datetime.utcnow() - datetime.timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
     def _GetDatetimeDaysBefore(self, days):
-        return datetime.datetime.now() - datetime.timedelta(days=days)
+        # truncated to the minute so that repeated queries hit the HTTP cache
+        return (datetime.datetime.now() - datetime.timedelta(days=days)).replace(second=0, microsecond=0)
 
     def _ExecFuncByDateRange(self, func, days_start, days_end, **kwargs):
         if days_start:
@@ -127,65 +250,348 @@ class SgTableFetcher:
             else:
                 return func(**kwargs)
     
-    def Fetch(self, label):
+    def _GetPushdownParams(self, sub_name, condition):
+        """Returns the API parameters that pre-filter sub_name by condition (which is still evaluated locally)."""
+        params = {}
+        if not condition:
+            return params
+        pushdowns = self._PUSHDOWN_PARAMS.get(sub_name, {})
+        for field, opr, val in SgExpression.ExtractComparisons(condition):
+            param = pushdowns.get((field, opr))
+            if not param or not isinstance(val, basestring):
+                continue
+            if param == "labels":  # GitHub returns the issues having all of the labels
+                params.setdefault(param, []).append(val)
+            elif param == "state" and val not in (u"open", u"closed"):
+                continue
+            else:
+                params.setdefault(param, val)
+        return params
+
+    def _SetQuota(self, listings):
+        self._quota = _RowQuota(self._condition, self._limit, listings) if self._limit else None
+
+    def _GetLastPage(self, page):
+        """Returns the number of the last page in the Link header of a fetched page, None if there's none."""
+        for link in page[0]._headers.get("link", "").split(", ") if page else []:
+            if link.endswith('rel="last"'):
+                query = urlparse.urlparse(link[1:link.index(">")]).query
+                return int(urlparse.parse_qs(query)["page"][0])
+        return None
+
+    def _IterPages(self, objs):
+        """Iterates over a listing, with the pages after the first one requested concurrently if possible.
+
+        Listings stopping at a LIMIT are iterated page by page, requesting pages ahead would be wasted.
+        """
+        if not isinstance(objs, PaginatedList) or self._page_concurrency <= 1 or self._quota:
+            return iter(objs)
+        return self._IterPagesConcurrently(objs)
+
+    def _IterPagesConcurrently(self, objs):
+        # the first page tells the number of pages, the rest are requested in waves so that breaking off stops it
+        page = objs.get_page(0)
+        for obj in page:
+            yield obj
+        last_page = self._GetLastPage(page)
+        if last_page is None:  # no "last" link, follow "next" links one page at a time
+            num = 1
+            while page and 'rel="next"' in page[0]._headers.get("link", ""):
+                page = objs.get_page(num)
+                for obj in page:
+                    yield obj
+                num += 1
+            return
+        pool = ThreadPool(self._page_concurrency)
+        try:
+            for start in range(1, last_page, self._page_concurrency):
+                for page in pool.map(objs.get_page, range(start, min(start + self._page_concurrency, last_page))):
+                    for obj in page:
+                        yield obj
+        finally:
+            pool.close()
+            pool.join()
+
+    def _ListRepos(self, repos):
+        """Returns the list of repos, only those named in self._repo_names if set."""
+        repos = list(self._IterPages(repos))
+        if self._repo_names is not None:
+            repos = [repo for repo in repos if repo.name.lower() in self._repo_names]
+        return repos
+
+    def _MapRepos(self, func, repos):
+        """Applies func(idx, repo) to every repo of the list with a bounded pool of workers, results are in the order of repos."""
+        self._SetQuota(len(repos))
+        workers = min(self._concurrency, len(repos))
+        # the workers share the concurrency, a single big repo gets it all for its pages
+        self._page_concurrency = max(1, self._concurrency // max(1, workers))
+        if workers <= 1:
+            return [func(idx, repo) for idx, repo in enumerate(repos)]
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(lambda args: func(*args), enumerate(repos), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _FetchRows(self, objs, idx=0):
+        fields = None
+        rows = []
+        quota = self._quota
+        if quota and quota.IsMet(idx):
+            quota.Skip()
+            return fields, rows
+        start_time = time.time()
+        chunk_start = 0
+        for obj in self._IterPages(objs):
+            if fields is None:
+                fields = self._GetKeys(obj)
+            rows.append(self._GetVals(obj))
+            # checked at page boundaries, breaking here keeps the next page from being requested
+            if quota and len(rows) - chunk_start == self._page_size:
+                if quota.Count(idx, fields, rows[chunk_start:]):
+                    quota.Stop()
+                    break
+                chunk_start = len(rows)
+        if self._metrics:
+            self._metrics.AddListing(len(rows), time.time() - start_time)
+        return fields, rows
+
+    def _MergeRows(self, table, results):
+        for fields, rows in results:
+            if fields and not table.GetFields():
+                table.SetFields(fields)
+            for row in rows:
+                table.Append(row)
+
+    def _ToGitCommit(self, commit):
+        git_commit = commit.commit
+        try:
+            setattr(git_commit, u"login", commit.author.login if commit.author else None)
+        except AttributeError:  # TODO(lnishan): unknown author, need to track down PyGithub bug
+            setattr(git_commit, u"login", None)
+        return git_commit
+
+    def _ListChanges(self, repo, high_water):
+        """Returns the (key, sort key, state, updated, raw payload) items of repo changed since high_water (all if None)."""
+        since = schema.ParseDatetime(high_water) if high_water else None
+        if self._source == u"issues":
+            objs = repo.get_issues(state=u"all", sort=u"updated", direction=u"asc", since=since) if since else repo.get_issues(state=u"all")
+        elif self._source == u"pulls":  # no since for pulls, the listing stops at the high-water mark instead
+            objs = repo.get_pulls(state=u"all", sort=u"updated", direction=u"desc")
+        else:
+            objs = repo.get_commits(since=since) if since else repo.get_commits()
+        items = []
+        for obj in self._IterPages(objs):
+            raw = obj._rawData
+            if self._source == u"commits":
+                updated = raw[u"commit"][u"committer"][u"date"]
+                items.append((raw[u"sha"], updated, None, updated, raw))
+            else:
+                updated = raw[u"updated_at"]
+                if self._source == u"pulls" and high_water and updated < high_water:
+                    break
+                items.append((raw[u"number"], raw[u"number"], raw[u"state"], updated, raw))
+        return items
+
+    def _SyncReplica(self, org, org_name):
+        """Brings the replica of self._source in org up to date, requesting only what changed since the last sync."""
+        high_waters = self._replica.GetHighWaterMarks(org_name, self._source)
+        repos = list(self._IterPages(org.get_repos()))
+        synced_at = time.time()  # before listing, changes made during the sync are picked up by the next one
+        # every repo is synced (self._repo_names aside), changes[i] has to be the items of repos[i]
+        changes = self._MapRepos(lambda idx, repo: self._ListChanges(repo, high_waters.get(repo.name)), repos)
+        for position, (repo, items) in enumerate(zip(repos, changes)):
+            high_water = max([high_waters.get(repo.name)] + [updated for _, _, _, updated, _ in items])
+            self._replica.Update(org_name, self._source, repo.name, position, items, high_water, synced_at)
+        self._replica.RemoveOtherRepos(org_name, self._source, [repo.name for repo in repos])
+
+    def _LazyObject(self, cls, raw):
+        """Returns a function building the PyGithub object of raw on its first call."""
+        objs = []
+        def GetObj():
+            if not objs:
+                objs.append(cls(self._github._Github__requester, {}, raw, completed=False))
+            return objs[0]
+        return GetObj
+
+    def _FetchFromReplica(self, org, org_name, add_info, max_staleness):
+        """Answers from the replica, synced first if it's older than max_staleness seconds."""
+        self._limit = None  # a sync lists every change
+        synced_at = self._replica.GetSyncedAt(org_name, self._source)
+        if synced_at is None or time.time() - synced_at > max_staleness:
+            self._SyncReplica(org, org_name)
+        state, since, until = None, None, None
+        if self._source == u"issues":
+            state = self._ParseStateInfo(add_info)
+            days = self._ParseDaysInfo(add_info)
+            since = self._GetTimestampDaysBefore(days) if days else None
+        elif self._source == u"pulls":
+            state = self._ParseStateInfo(add_info)
+        else:
+            days_start, days_end = self._ParseDateRangeInfo(add_info)
+            since = self._GetTimestampDaysBefore(days_start) if days_start else None
+            until = self._GetTimestampDaysBefore(days_end) if days_end else None
+        cls = {u"issues": Issue, u"pulls": PullRequest, u"commits": Commit}[self._source]
+        ret = tb.SgTable()
+        ret.SetFields(self._GetKeys(None))
+        for raw in self._replica.Load(org_name, self._source, state if state != u"all" else None, since, until):
+            ret.Append(self._Project(raw, self._LazyObject(cls, raw)))
+        return ret
+
+    def GetCompletionFields(self, label):
+        """Returns the fields of label to fetch which cost one extra request per row."""
+        _, sub_name, _ = self._Parse(label)
+        return schema.GetCompletionFields(sub_name, self._rel_keys)
+
+    def Describe(self, label, condition=None, limit=None, max_staleness=None, late_fields=None):
+        """Returns how label would be fetched, for EXPLAIN."""
+        _, sub_name, _ = self._Parse(label)
+        if max_staleness is not None and self._replica and sub_name in self._REPLICATED_SOURCES:
+            return u"%s from the local replica, synced first if older than %ds" % (label, max_staleness)
+        details = [label]
+        if sub_name in self._REPLICATED_SOURCES:
+            details.append(u"listed repo by repo, %d requests at a time" % self._concurrency)
+        params = self._GetPushdownParams(sub_name, condition)
+        if params:
+            details.append(u"API filters: " + u", ".join(u"%s=%s" % (key, u"|".join(val) if isinstance(val, list) else val) for key, val in sorted(params.items())))
+        if limit:
+            details.append(u"stops after %d rows" % limit)
+        completion_fields = [field for field in schema.GetCompletionFields(sub_name, self._rel_keys) if field not in (late_fields or [])]
+        if completion_fields:
+            details.append(u"one extra request per row for " + u", ".join(completion_fields))
+        return u", ".join(details)
+
+    def DescribeMaterialize(self, fields):
+        """Returns how fields left out of the fetch would be added, for EXPLAIN."""
+        return u"%s from the full object of each row left, %d requests at a time" % (u", ".join(fields), self._concurrency)
+
+    def GetSources(self, label):
+        """Returns the (org, source type) pairs label is read from, source types being those of SgHttpCache."""
+        org_name, sub_name, _ = self._Parse(label)
+        if sub_name is None:
+            return [(org_name, u"default")]
+        elif sub_name == u"repos":
+            return [(org_name, u"repos")]
+        return [(org_name, u"repos"), (org_name, sub_name)]  # the repos are listed first
+
+    def SetMetrics(self, metrics):
+        self._metrics = metrics
+
+    def GetStats(self):
+        return dict(self._stats)
+
+    def EstimateRows(self, label):
+        """Returns a rough estimate of the rows of label, without any request."""
+        _, sub_name, add_info = self._Parse(label)
+        rows = self._ROW_ESTIMATES.get(sub_name, self._ROW_ESTIMATES[u"commits"])
+        if sub_name in (u"issues", u"pulls"):
+            days = self._ParseDaysInfo(add_info)
+            if days:
+                rows = rows * min(days, self._DAYS_ESTIMATED) // self._DAYS_ESTIMATED
+            if self._ParseStateInfo(add_info) != u"all":
+                rows //= 2
+        elif sub_name == u"commits":
+            days_start, days_end = self._ParseDateRangeInfo(add_info)
+            if days_start:
+                rows = rows * min(days_start - (days_end or 0), self._DAYS_ESTIMATED) // self._DAYS_ESTIMATED
+        return max(1, rows)
+
+    def Materialize(self, label, table, fields):
+        """Returns table with fields added, read from the full object of each row (one request per row).
+
+        The rows of table have to have their url, like the ones fetched with late_fields.
+        The objects are requested concurrently.
+        """
+        _, sub_name, _ = self._Parse(label)
+        cls = self._COMPLETED_CLASSES[sub_name]
+        requester = self._github._Github__requester
+        def GetVals(url):
+            obj = cls(requester, {}, {u"url": url}, completed=False)  # requested on the first field read
+            return [self.__ConvertVal(getattr(obj, field)) for field in fields]
+        urls = table.GetVals(u"url")
+        workers = min(self._concurrency, len(urls))
+        if workers <= 1:
+            rows = [GetVals(url) for url in urls]
+        else:
+            pool = ThreadPool(workers)
+            try:
+                rows = pool.map(GetVals, urls, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        late_table = tb.SgTable()
+        late_table.SetFields(fields)
+        late_table.SetCols([list(column) for column in zip(*rows)] if rows else [[] for _ in fields], len(rows))
+        return table.Chain(late_table)
+
+    def Fetch(self, label, condition=None, limit=None, max_staleness=None, repos=None, late_fields=None):
+        """Fetches label, stops early once limit rows meeting condition have been fetched (if given).
+
+        With max_staleness (in seconds), issues, pulls and commits are answered from the replica.
+        With repos (names), only those repos' issues, pulls and commits are listed
+        (rows of other repos may be returned anyway, eg. from the store or the replica).
+        late_fields (of GetCompletionFields) are left out, the url of each row is fetched
+        instead so that Materialize can add them to the rows needed.
+        """
         ret = tb.SgTable()
         org_name, sub_name, add_info = self._Parse(label)
+        params = self._GetPushdownParams(sub_name, condition)
+        self._source = sub_name
+        self._condition = condition
+        self._limit = limit
+        self._quota = None
+        self._page_concurrency = self._concurrency
+        self._repo_names = set(name.lower() for name in repos) if repos is not None and sub_name in self._REPLICATED_SOURCES else None
+        self._late_fields = late_fields or []
+        use_store = self._store is not None and sub_name in schema.LISTED_FIELDS and max_staleness is None
+        if use_store:
+            store_params = dict(params)
+            if self._repo_names is not None:
+                store_params["repos"] = sorted(self._repo_names)
+            stored = self._store.Get(label, store_params, self._GetKeys(None))
+            if stored is not None:
+                return stored
         org = self._github.get_organization(org_name)
+        if max_staleness is not None and self._replica and sub_name in self._REPLICATED_SOURCES:
+            return self._FetchFromReplica(org, org_name, add_info, max_staleness)
         if sub_name == None:  # eg. "google"
             ret.SetFields(self._GetKeys(org))
             ret.Append(self._GetVals(org))
         elif sub_name == u"repos":
-            repos = org.get_repos()
-            for repo in repos:
-                if not ret.GetFields():
-                    ret.SetFields(self._GetKeys(repo))
-                ret.Append(self._GetVals(repo))
+            self._SetQuota(1)
+            self._MergeRows(ret, [self._FetchRows(org.get_repos())])
         elif sub_name == u"issues":
-            days = None
-            state = u"open"
-            if add_info:
-                for info in add_info:
-                    if util.IsNumeric(info):
-                        days = int(info)
-                    elif info in (u"all", u"open", u"closed"):
-                        state = info
-            repos = org.get_repos()
-            for repo in repos:
-                issues = repo.get_issues(state=state, since=self._GetDatetimeDaysBefore(days)) if days else repo.get_issues(state=state)
-                for issue in issues:
-                    if not ret.GetFields():
-                        ret.SetFields(self._GetKeys(issue))
-                    ret.Append(self._GetVals(issue))
+            days = self._ParseDaysInfo(add_info)
+            state = self._ParseStateInfo(add_info)
+            if state == u"all":
+                state = params.pop("state", state)
+            params.pop("state", None)  # eg. "org.issues.closed where state = 'open'" is empty anyway
+            def FetchIssues(idx, repo):
+                kwargs = dict(params)
+                if "labels" in kwargs:
+                    kwargs["labels"] = [Label(repo._requester, {}, {"name": name}, completed=True) for name in kwargs["labels"]]
+                issues = repo.get_issues(state=state, since=self._GetDatetimeDaysBefore(days), **kwargs) if days else repo.get_issues(state=state, **kwargs)
+                return self._FetchRows(issues, idx)
+            self._MergeRows(ret, self._MapRepos(FetchIssues, self._ListRepos(org.get_repos())))
         elif sub_name == u"pulls":
-            state = u"open"
-            if add_info:
-                for info in add_info:
-                    if info in (u"all", u"open", u"closed"):
-                        state = info
-            repos = org.get_repos()
-            for repo in repos:
-                pulls = repo.get_pulls(state=state)
-                for pull in pulls:
-                    if not ret.GetFields():
-                        ret.SetFields(self._GetKeys(pull))
-                    ret.Append(self._GetVals(pull))
+            state = self._ParseStateInfo(add_info)
+            if state == u"all":
+                state = params.pop("state", state)
+            params.pop("state", None)
+            def FetchPulls(idx, repo):
+                return self._FetchRows(repo.get_pulls(state=state, **params), idx)
+            self._MergeRows(ret, self._MapRepos(FetchPulls, self._ListRepos(org.get_repos())))
         elif sub_name == u"commits":
-            days_start, days_end = None, None
-            if add_info:
-                for info in add_info:
-                    if self._IsDateRange(info):
-                        days_start, days_end = self._ParseDateRange(info)
-            repos = org.get_repos()
-            for repo in repos:
+            days_start, days_end = self._ParseDateRangeInfo(add_info)
+            def FetchCommits(idx, repo):
                 commits = self._ExecFuncByDateRange(repo.get_commits,
-                                                    days_start, days_end)
-                for commit in commits:
-                    git_commit = commit.commit
-                    try:
-                        setattr(git_commit, u"login", commit.author.login if commit.author else None)
-                    except AttributeError:  # TODO(lnishan): unknown author, need to track down PyGithub bug
-                        setattr(git_commit, u"login", None)
-                    if not ret.GetFields():
-                        ret.SetFields(self._GetKeys(git_commit))
-                    ret.Append(self._GetVals(git_commit))
+                                                    days_start, days_end, **params)
+                return self._FetchRows(commits, idx)
+            self._MergeRows(ret, self._MapRepos(FetchCommits, self._ListRepos(org.get_repos())))
+        if self._quota:
+            self._stats["listings_skipped"] += self._quota.skipped
+            self._stats["listings_stopped"] += self._quota.stopped
+        if use_store and not (self._quota and (self._quota.skipped or self._quota.stopped)):  # only complete tables
+            self._store.Put(label, store_params, self._GetKeys(None), self.GetSources(label), ret)
         return ret
@@ -1,3 +1,5 @@
+import hashlib
+import os
 import sys
 import time
 
@@ -10,8 +12,15 @@ from prompt_toolkit.styles import style_from_pygments
 from pygments.lexers.sql import MySqlLexer
 from pygments.styles.monokai import MonokaiStyle
 
+import config_loader
 import definition
+import explain
+import http_cache
 import parser
+import replica
+import request_scheduler
+import result_cache
+import source_store
 import utilities as util
 import tokenizer
 
@@ -20,38 +29,138 @@ class SQLGitHub:
     """Meta Component for SQLGitHub."""
 
     _PROMPT_STR = u"SQLGitHub> "
+    _PER_PAGE = 100  # the maximum GitHub allows, fewer pages to request
 
-    def __init__(self, token, output="str"):
-        self._github = Github(token)
+    FAILED = object()  # what Execute returns for a statement that failed (reported on stderr)
+
+    def __init__(self, token, output="str", tokens=None, fetch_concurrency=4, use_cache=True, cache_dir="http_cache", cache_ttls=None, cache_max_size=http_cache.SgHttpCache.DEFAULT_MAX_SIZE, replica_path="replica.sqlite", result_cache_ttl=result_cache.SgResultCache.DEFAULT_TTL, store_max_size=source_store.SgSourceStore.DEFAULT_MAX_SIZE, metrics=None):
+        tokens = [token] + [other for other in tokens or [] if other != token]
+        self._github = Github(token, per_page=self._PER_PAGE)
+        self._scheduler = request_scheduler.SgRequestScheduler()
+        self._scheduler.Install(self._github, [Github(other, per_page=self._PER_PAGE) for other in tokens[1:]])
+        self._metrics = metrics  # SgMetrics of every query executed (profiling)
+        if metrics:
+            metrics.Install(self._github)  # under the cache, only requests over the network are timed
+        self._http_cache = None
+        self._result_cache = None
+        self._replica = replica.SgReplica(replica_path)
+        self._store = source_store.SgSourceStore(store_max_size, cache_ttls)
+        self._replica.AddListener(self._store.Invalidate)
+        if use_cache:
+            namespace = hashlib.sha1(u"".join(tokens)).hexdigest()
+            self._http_cache = http_cache.SgHttpCache(cache_dir, cache_ttls, cache_max_size, namespace=namespace)
+            self._http_cache.Install(self._github)
+            self._result_cache = result_cache.SgResultCache(os.path.join(cache_dir, "results"), result_cache_ttl, namespace=namespace)
+            self._http_cache.AddListener(self._result_cache.Invalidate)
+            self._http_cache.AddListener(self._store.Invalidate)
+            self._replica.AddListener(self._result_cache.Invalidate)
         self._output = output
-        self._parser = parser.SgParser(self._github)
+        self._fetch_options = {"concurrency": fetch_concurrency, "replica": self._replica, "store": self._store}  # keyword arguments for SgTableFetcher
+        self._parser = parser.SgParser(self._github, self._fetch_options)
         self._completer = WordCompleter(definition.ALL_TOKENS,
                                         ignore_case=True)
         self._style = style_from_pygments(MonokaiStyle)
 
+    def _Set(self, tokens):
+        """Applies "SET name = value", returns FAILED (reported on stderr) if it can't be applied."""
+        name = next((token for token in tokens if token), u"").split(u"=")[0].lower()
+        if name not in config_loader.SETTINGS:
+            sys.stderr.write("Unknown setting: %s\n" % name)
+            return self.FAILED
+        if name != u"fetch_concurrency":
+            sys.stderr.write("Setting %s can only be changed in the config file.\n" % name)
+            return self.FAILED
+        assignment = u"".join(tokens).split(u"=")
+        if len(assignment) != 2 or not util.IsNumeric(assignment[1]):
+            sys.stderr.write("SQL syntax incorrect.\n")
+            return self.FAILED
+        self._fetch_options["concurrency"] = int(assignment[1])
+
+    def _Refresh(self, tokens):
+        """Drops what's held of a source (eg. "servo.issues", or "servo" for all of its sources) so that it's fetched again."""
+        labels = [token for token in tokens if token]
+        if len(labels) != 1:
+            raise SyntaxError("SQL syntax incorrect.")
+        parts = labels[0].split(u".")
+        source_types = [parts[1]] if len(parts) > 1 else [u"default", u"repos", u"issues", u"pulls", u"commits"]
+        for source_type in source_types:
+            self._store.Invalidate(parts[0], source_type)
+            if self._result_cache:
+                self._result_cache.Invalidate(parts[0], source_type)
+            if self._http_cache:
+                self._http_cache.Expire(parts[0], source_type)
+
+    def _GetNetworkCounters(self):
+        """Returns the counters of SgExplainer.COUNTERS so far."""
+        stats = self._scheduler.GetStats()
+        cache_stats = self._http_cache.GetStats() if self._http_cache else {"hits": 0, "revalidated": 0}
+        return {u"requests": stats["requests"],
+                u"bytes": stats["bytes"],
+                u"cache hits": cache_stats["hits"] + cache_stats["revalidated"],
+                u"rate limit used": stats["rate_limit_used"]}
+
     def Execute(self, sql, display_result=True):
+        """Executes a statement, returns (result, execution time), None for SET and REFRESH, or FAILED."""
         if not sql:
             return
         start_time = time.time()
+        cache_stats = self._http_cache.GetStats() if self._http_cache else None
+        store_stats = self._store.GetStats()
         tokens = tokenizer.SgTokenizer.Tokenize(sql)
         try:
+            if tokens[0].lower() == u"set":
+                return self._Set(tokens[1:])
+            elif tokens[0].lower() == u"refresh":
+                self._Refresh(tokens[1:])
+                return
+            explain_mode = None
+            if tokens[0].lower() == u"explain":
+                explain_mode = u"analyze" if len(tokens) > 1 and tokens[1].lower() == u"analyze" else u"plan"
+                tokens = tokens[2:] if explain_mode == u"analyze" else tokens[1:]
             session = self._parser.Parse(tokens)
         except NotImplementedError:
             sys.stderr.write("Not implemented command tokens in SQL.\n")
+            return self.FAILED
         except SyntaxError:
             sys.stderr.write("SQL syntax incorrect.\n")
+            return self.FAILED
         else:
+            result = self._result_cache.Get(tokens) if self._result_cache and not explain_mode and not self._metrics else None
             try:
-                result = session.Execute()
+                if explain_mode == u"plan":
+                    result = explain.GetPlanTable(session.GetPlan())
+                elif explain_mode == u"analyze":  # always executed, the cached result wouldn't tell much
+                    result = session.Explain(explain.SgExplainer(self._GetNetworkCounters))
+                elif result is None:
+                    completion_fields = session.GetCompletionFields()
+                    if completion_fields:
+                        sys.stderr.write("Warning: %s not in GitHub's list responses, costs one extra request per row left after WHERE (and LIMIT).\n" % u", ".join(completion_fields))
+                    result = session.Execute(self._metrics)
+                    if self._result_cache:
+                        self._result_cache.Put(tokens, session.GetSources(), result, session.GetMaxStaleness())
             except AttributeError:
                 sys.stderr.write("One or more of the specified fields doesn't exist.\n")
+                return self.FAILED
             else:
                 exec_time = time.time() - start_time
                 if display_result:
                     util.PrintResult(result, self._output)
                     print("-")
                     print("Total rows: %d" % (len(result)))
-                    print("Total execution time: %.3fs"% (exec_time))
+                    if self._result_cache:
+                        result_cache_stats = self._result_cache.GetStats()
+                        print("Total execution time: %.3fs (result cache: %d hits, %d misses)" % (exec_time, result_cache_stats["hits"], result_cache_stats["misses"]))
+                    else:
+                        print("Total execution time: %.3fs"% (exec_time))
+                    fetch_stats = session.GetStats()
+                    if fetch_stats["listings_skipped"] or fetch_stats["listings_stopped"]:
+                        print("Early termination: skipped %d repositories, stopped %d listings before their last page" % (fetch_stats["listings_skipped"], fetch_stats["listings_stopped"]))
+                    new_store_stats = self._store.GetStats()
+                    if new_store_stats["hits"] > store_stats["hits"]:
+                        print("Source store: %d sources reused (%d tables held, ~%d MB)" % (new_store_stats["hits"] - store_stats["hits"], new_store_stats["entries"], new_store_stats["size"] // (1024 * 1024)))
+                    if cache_stats:
+                        new_cache_stats = self._http_cache.GetStats()
+                        print("HTTP cache: %d hits, %d revalidated, %d misses" % tuple(new_cache_stats[stat] - cache_stats[stat] for stat in ("hits", "revalidated", "misses")))
                 return result, exec_time
 
     def Start(self):
@@ -0,0 +1,200 @@
+"""Unions of sessions.
+
+The branches of a union are executed at once, each one fetching and evaluating
+its own session, so a union takes about as long as its slowest branch. UNION
+drops duplicate rows with a hash set of the rows seen (the first one is kept),
+UNION ALL keeps them. ORDER BY and LIMIT after the last branch apply to the
+whole union, on the fields of the first branch.
+
+Sample Usage:
+    g = Github(token)
+    branches = [SgSession(g, ["title"], "servo.issues.closed.7"), SgSession(g, ["title"], "servo.pulls.closed.7")]
+    u = SgUnion(branches, [False], [["title"], [1]], 10)
+    print(u.Execute())
+"""
+
+from multiprocessing.pool import ThreadPool
+
+import table as tb
+import utilities as util
+from expression import SgExpression
+from ordering import SgOrdering
+
+
+def _Distinct(rows):
+    """Returns rows without duplicates, keeping the first of each."""
+    seen = set()
+    ret = []
+    for row in rows:
+        key = util.HashKey(row)
+        if key not in seen:
+            seen.add(key)
+            ret.append(row)
+    return ret
+
+
+class _PrefixedExplainer:
+    """Passes the stages of a branch on to the explainer of the union, named after the branch."""
+
+    def __init__(self, explainer, prefix):
+        self._explainer = explainer
+        self._prefix = prefix
+
+    def Begin(self, stage, rows_in=None):
+        self._explainer.Begin(self._prefix + stage, rows_in)
+
+    def __getattr__(self, name):  # End, and AddListing, AddExpressionTime of SgMetrics
+        return getattr(self._explainer, name)
+
+
+class SgUnion:
+    """Unions of sessions."""
+
+    def __init__(self, branches, distincts, orders=None, limit=None):
+        """distincts[i] is whether branches[i + 1] is added with UNION (rather than UNION ALL)."""
+        self._branches = branches
+        self._distincts = distincts
+        self._orders = orders
+        self._limit = limit
+        self._explainer = None  # SgExplainer measuring the stages (EXPLAIN ANALYZE), or SgMetrics
+        self._with_metrics = False
+
+    def _GetPrefix(self, idx):
+        return u"branch %d: " % (idx + 1)
+
+    def _GetDistinctBranches(self):
+        """Returns how many branches (from the first) are deduplicated together, 0 for none."""
+        last = [idx + 2 for idx, distinct in enumerate(self._distincts) if distinct]
+        return last[-1] if last else 0  # (a UNION ALL b) UNION c has no duplicates of a, b or c left
+
+    def _Begin(self, stage, rows_in=None):
+        if self._explainer:
+            self._explainer.Begin(stage, rows_in)
+
+    def _End(self, rows_out):
+        if self._explainer:
+            self._explainer.End(rows_out)
+
+    def _ExecuteBranch(self, idx):
+        branch = self._branches[idx]
+        if not self._explainer:
+            return branch.Execute()
+        explainer = _PrefixedExplainer(self._explainer, self._GetPrefix(idx))
+        return branch.Execute(explainer) if self._with_metrics else branch.Measure(explainer)
+
+    def _GetFields(self, tables):
+        fields = tables[0].GetFields()
+        if fields == [u"*"]:  # select * without any row, the fields are only known from another branch
+            fields = next((table.GetFields() for table in tables if len(table)), fields)
+        for table in tables:
+            if len(table) and len(table.GetFields()) != len(fields):
+                raise SyntaxError("Branches of a UNION need the same number of fields.")
+        return fields
+
+    def _EvaluateOrders(self, table):
+        """Returns the table of the order by values, taking the column of an expression naming a field (eg. "count(sha)")."""
+        fields = table.GetFields()
+        ret = tb.SgTable()
+        ret.SetFields(self._orders[0])
+        ret.SetCols([table.GetVals(expr) if expr in fields else SgExpression.EvaluateExpression(table, expr) for expr in self._orders[0]], len(table))
+        return ret
+
+    def GetPlan(self):
+        """Returns [(stage, detail)] of the stages the union goes through (before knowing any rows)."""
+        plan = []
+        for idx, branch in enumerate(self._branches):
+            plan += [(self._GetPrefix(idx) + stage, detail) for stage, detail in branch.GetPlan()]
+        detail = u"%d branches executed at once" % len(self._branches)
+        distinct_branches = self._GetDistinctBranches()
+        if distinct_branches:
+            detail += u", duplicates among branches 1-%d dropped with a hash set" % distinct_branches
+        plan.append((u"union", detail))
+        if self._orders:
+            plan.append((u"order", u", ".join(u"%s %s" % (expr, u"ASC" if reverse == 1 else u"DESC") for expr, reverse in zip(*self._orders)) +
+                         (u", top %d with a bounded heap" % self._limit if self._limit else u"")))
+        if self._limit:
+            plan.append((u"limit", unicode(self._limit)))
+        return plan
+
+    def Measure(self, explainer):
+        """Executes the union, measuring its stages with explainer, returns the result."""
+        self._explainer = explainer
+        try:
+            return self._Execute()
+        finally:
+            self._explainer = None
+
+    def Explain(self, explainer):
+        """Executes the union, measuring its stages with explainer, returns the table of the measurements."""
+        self.Measure(explainer)
+        return explainer.GetTable(dict(self.GetPlan()))
+
+    def Execute(self, metrics=None):
+        """Executes the union, recording its stages, listings and expression timings in metrics (a SgMetrics) if given."""
+        if metrics is None:
+            return self._Execute()
+        self._with_metrics = True
+        try:
+            return self.Measure(metrics)
+        finally:
+            self._with_metrics = False
+
+    def _Execute(self):
+        indices = range(len(self._branches))
+        if self._explainer:  # one branch at a time, so that the stages measured don't overlap
+            tables = [self._ExecuteBranch(idx) for idx in indices]
+        else:
+            pool = ThreadPool(len(self._branches))
+            try:
+                tables = pool.map(self._ExecuteBranch, indices)
+            finally:
+                pool.close()
+                pool.join()
+
+        self._Begin(u"union", sum(len(table) for table in tables))
+        fields = self._GetFields(tables)
+        distinct_branches = self._GetDistinctBranches()
+        rows = [row for table in tables[:distinct_branches] for row in table]
+        if distinct_branches:
+            rows = _Distinct(rows)
+        rows += [row for table in tables[distinct_branches:] for row in table]
+        res_table = tb.SgTable()
+        res_table.SetFields(fields)
+        res_table.SetTable(rows)
+        self._End(len(res_table))
+
+        if self._orders and len(res_table):
+            self._Begin(u"order", len(res_table))
+            res_table = res_table.Chain(self._EvaluateOrders(res_table))
+            res_table = SgOrdering(res_table, self._orders[1]).Sort(limit=self._limit)
+            self._End(len(res_table))
+        if self._limit:
+            self._Begin(u"limit", len(res_table))
+            res_table.SetTable(res_table[:self._limit])
+            self._End(len(res_table))
+        return res_table
+
+    def GetCompletionFields(self):
+        """Returns the fields to fetch which cost one extra request per row."""
+        fields = []
+        for branch in self._branches:
+            fields += [field for field in branch.GetCompletionFields() if field not in fields]
+        return fields
+
+    def GetSources(self):
+        """Returns the (org, source type) pairs the result is computed from."""
+        sources = []
+        for branch in self._branches:
+            sources += [source for source in branch.GetSources() if source not in sources]
+        return sources
+
+    def GetMaxStaleness(self):
+        stalenesses = [branch.GetMaxStaleness() for branch in self._branches if branch.GetMaxStaleness() is not None]
+        return min(stalenesses) if stalenesses else None
+
+    def GetStats(self):
+        stats = {}
+        for branch in self._branches:
+            for key, val in branch.GetStats().items():
+                stats[key] = stats.get(key, 0) + val
+        return stats
@@ -1,13 +1,19 @@
 """Utilities for general operations."""
 
+import collections
+import sys
+import threading
 
-def PrintResult(table, output):
+
+def PrintResult(table, output, f=None):
+    """Writes table to a file object (stdout by default) in output format, a chunk of rows at a time."""
+    f = f or sys.stdout
     if output == "str":
-        print(table)
+        table.WriteStr(f)
     elif output == "csv":
-        print(table.InCsv())
+        table.WriteCsv(f)
     elif output == "html":
-        print(table.InHtml())
+        table.WriteHtml(f)
 
 def IsNumeric(num_str):
     try:
@@ -17,6 +23,15 @@ def IsNumeric(num_str):
     else:
         return True
 
+def ParseDuration(duration_str):
+    """Parses a duration like "90", "30s", "10m", "2h" or "1d" into seconds, raises SyntaxError if invalid."""
+    units = {u"s": 1, u"m": 60, u"h": 3600, u"d": 86400}
+    scale = units.get(duration_str[-1:].lower())
+    num_str = duration_str[:-1] if scale else duration_str
+    if not IsNumeric(num_str) or int(num_str) < 0:
+        raise SyntaxError("Invalid duration.")
+    return int(num_str) * (scale or 1)
+
 def GuaranteeUnicode(obj):
     if type(obj) == unicode:
         return obj
@@ -25,6 +40,10 @@ def GuaranteeUnicode(obj):
     else:
         return unicode(str(obj), "utf-8")
 
+def HashKey(vals):
+    """Returns vals as a hashable tuple, with lists (eg. labels) turned into tuples."""
+    return tuple(HashKey(val) if isinstance(val, list) else val for val in vals)
+
 def Unescape(ch):
     if ch == "0":
         return chr(0)
@@ -48,3 +67,37 @@ def Unescape(ch):
         return "\\%"
     elif ch == "_":
         return "\\_"
+
+
+class LruCache:
+    """A bounded mapping that evicts the least recently used entries."""
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def Get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            val = self._entries.pop(key)
+            self._entries[key] = val
+            return val
+
+    def Put(self, key, val):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = val
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
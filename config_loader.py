@@ -2,6 +2,9 @@
 
 import importlib
 
+# Optional settings passed on to SQLGitHub as keyword arguments (if present).
+SETTINGS = ["tokens", "fetch_concurrency", "cache_dir", "cache_ttls", "cache_max_size", "replica_path", "result_cache_ttl", "store_max_size"]
+
 
 def Load(module):
     try:
@@ -9,11 +12,14 @@ def Load(module):
     except ImportError:
         token = None
         output = "str"
+        settings = {}
     else:
         token = mod.token if hasattr(mod, "token") else None
         output = mod.output if hasattr(mod, "output") else "str"
+        settings = {key: getattr(mod, key) for key in SETTINGS if hasattr(mod, key)}
     
-    token = token or raw_input("Please enter your GitHub token (which can be obtained from https://github.com/settings/tokens): ")
+    token = token or (settings.get("tokens") or [None])[0] or raw_input("Please enter your GitHub token (which can be obtained from https://github.com/settings/tokens): ")
 
     return (token,
-            output)
+            output,
+            settings)
@@ -1,18 +1,47 @@
 #!/usr/bin/env python
 
 import argparse
+import cProfile
+import json
+import sys
+import time
 
 import config_loader
+from components import metrics as sg_metrics
 from components import top_level
 from components import utilities as util
 
 arg_parser = argparse.ArgumentParser()
 arg_parser.add_argument("sql", type=unicode, help="a line of sql for query")
+arg_parser.add_argument("--no-cache", action="store_true", help="bypass the HTTP response cache")
+arg_parser.add_argument("-o", "--output-file", help="write the result to a file instead of stdout")
+arg_parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                        help="write a cProfile dump to PREFIX.prof and metrics to PREFIX.json (default prefix: profile)")
 args = arg_parser.parse_args()
 
 
 if __name__ == "__main__":
-    token, output = config_loader.Load("config")
-    sqlserv = top_level.SQLGitHub(token, output)
-    result, exec_time = sqlserv.Execute(args.sql, display_result=False)
-    util.PrintResult(result, output)
+    token, output, settings = config_loader.Load("config")
+    metrics = sg_metrics.SgMetrics() if args.profile else None
+    sqlserv = top_level.SQLGitHub(token, output, use_cache=not args.no_cache, metrics=metrics, **settings)
+    if args.profile:
+        profiler = cProfile.Profile()
+        ret = profiler.runcall(sqlserv.Execute, args.sql, display_result=False)
+        profiler.dump_stats(args.profile + ".prof")
+        report = metrics.GetReport()
+        executed = isinstance(ret, tuple)
+        report.update({"query": args.sql, "time": ret[1] if executed else None, "rows": len(ret[0]) if executed else None, "created_at": time.time()})
+        with open(args.profile + ".json", "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        ret = sqlserv.Execute(args.sql, display_result=False)
+    if ret is sqlserv.FAILED:  # reported on stderr
+        sys.exit(1)
+    if ret is None:  # SET or REFRESH, no result to print
+        sys.exit(0)
+    result, exec_time = ret
+    if args.output_file:
+        with open(args.output_file, "wb") as f:
+            util.PrintResult(result, output, f)
+    else:
+        util.PrintResult(result, output)